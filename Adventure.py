@@ -100,13 +100,14 @@ class AdventureWindow(pyglet.window.Window):
         for s in ['options_appear.wav', 'select_1.wav', 'select_2.wav', 'select_3.wav', 
                   'select_4.wav', 'select_5.wav', 'select_6.wav', 'give.wav', 'take.wav']:
             pyglet.resource.media('sound/%s' % s, streaming=False)
-        for item in util.preload:
+        preload = util.assets.preload_list()
+        for item in preload:
             try:
                 util.load_image(item)
             except pyglet.resource.ResourceNotFoundException:
                 print "bad", item
             i += 1
-            self.load_fraction = float(i)/float(len(util.preload))
+            self.load_fraction = float(i)/float(len(preload))
             self.on_draw()
             self.flip()
 
@@ -0,0 +1,39 @@
+"""
+Checks every actor, environment and scene description, packs actor frames into atlases and
+writes the manifest the game preloads from. Runs headlessly; no window is opened.
+
+    python AssetBuilder.py            # Check everything, then write atlases and manifest.json
+    python AssetBuilder.py --check    # Only check
+"""
+
+import argparse, sys
+
+import pyglet
+
+pyglet.options['shadow_window'] = False     # Images are decoded and saved, never drawn
+
+import engine
+from engine.util import assets, settings
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the game\'s atlases and asset manifest.')
+    parser.add_argument('--check', action='store_true',
+                        help='only validate the resources, without writing anything')
+    args = parser.parse_args()
+    
+    engine.init()
+    print 'Resources in %s' % settings.resources_path
+    
+    def log(message):
+        print message
+        sys.stdout.flush()
+    
+    errors = assets.build(write=not args.check, log=log)
+    for error in errors:
+        print 'ERROR %s' % error
+    if errors:
+        print '%d problems found; nothing was written' % len(errors)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,253 @@
+"""
+Walk path pathfinding benchmarks. Runs headlessly; no window or resources are needed.
+
+Builds synthetic walk paths (grids, long corridors and random geometric graphs, optionally
+split into disconnected islands), then times the queries a click goes through and reports
+latency percentiles and search node expansions for each.
+
+    python WalkPathBenchmark.py
+    python WalkPathBenchmark.py --sizes 100,1000 --queries 50 --kinds grid,corridor
+"""
+
+import argparse, json, math, random, sys, timeit
+
+import pyglet
+
+pyglet.options['shadow_window'] = False     # Don't open a GL context just for imports
+
+from engine import actor
+from engine.util import astar, dijkstra, walkpath
+
+# Graph generators. Each returns a two-way WalkPath with about n points.
+
+def _connect(wp, a, b):
+    wp.add_edge(a, b)
+    wp.add_edge(b, a)
+
+def make_grid(n, spacing=50, x0=0, y0=0, prefix=''):
+    side = max(2, int(math.ceil(math.sqrt(n))))
+    wp = walkpath.WalkPath()
+    name = lambda i, j: '%sg%d_%d' % (prefix, i, j)
+    for i in xrange(side):
+        for j in xrange(side):
+            wp.add_point(x0 + i*spacing, y0 + j*spacing, name(i, j))
+    for i in xrange(side):
+        for j in xrange(side):
+            if i+1 < side:
+                _connect(wp, name(i, j), name(i+1, j))
+            if j+1 < side:
+                _connect(wp, name(i, j), name(i, j+1))
+    return wp
+
+def make_corridor(n, spacing=50, lanes=3, row_length=40):
+    """A corridor lanes points wide that snakes back and forth, so paths are very long"""
+    wp = walkpath.WalkPath()
+    length = max(2, n // lanes)
+    name = lambda k, lane: 'c%d_%d' % (k, lane)
+    for k in xrange(length):
+        row, column = divmod(k, row_length)
+        if row % 2:
+            column = row_length - 1 - column
+        for lane in xrange(lanes):
+            wp.add_point(column*spacing, (row*(lanes+1) + lane)*spacing, name(k, lane))
+    for k in xrange(length):
+        for lane in xrange(lanes):
+            if k+1 < length:
+                _connect(wp, name(k, lane), name(k+1, lane))
+            if lane+1 < lanes:
+                _connect(wp, name(k, lane), name(k, lane+1))
+    return wp
+
+def make_geometric(n, spacing=50, degree=5.0, rng=random):
+    """Points scattered uniformly and joined to every neighbor within a radius giving
+    about degree edges per point. Sparse areas leave small disconnected clusters."""
+    size = spacing * math.sqrt(n)
+    radius = math.sqrt(degree * size * size / (math.pi * n))
+    wp = walkpath.WalkPath()
+    buckets = {}
+    for i in xrange(n):
+        x, y = rng.uniform(0, size), rng.uniform(0, size)
+        wp.add_point(x, y, 'r%d' % i)
+        buckets.setdefault((int(x // radius), int(y // radius)), []).append(('r%d' % i, x, y))
+    for (bx, by), members in buckets.iteritems():
+        for a, ax, ay in members:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for b, x, y in buckets.get((bx+dx, by+dy), ()):
+                        if a < b and (x-ax)**2 + (y-ay)**2 <= radius*radius:
+                            _connect(wp, a, b)
+    return wp
+
+def make_islands(n, islands=4, spacing=50):
+    """Separate grids with no edges between them"""
+    side = max(2, int(math.ceil(math.sqrt(n // islands))))
+    wp = walkpath.WalkPath()
+    for k in xrange(islands):
+        part = make_grid(n // islands, spacing, x0=k*(side+2)*spacing, prefix='i%d_' % k)
+        for identifier, (x, y) in part.points.iteritems():
+            wp.add_point(x, y, identifier)
+        for (a, b) in part.edges:
+            wp.add_edge(a, b)
+    return wp
+
+generators = {
+    'grid': lambda n, rng: make_grid(n),
+    'corridor': lambda n, rng: make_corridor(n),
+    'geometric': lambda n, rng: make_geometric(n, rng=rng),
+    'islands': lambda n, rng: make_islands(n),
+}
+
+
+# Measurement
+
+class BenchmarkScene(object):
+    """Just enough of a Scene for Actor's walk path methods"""
+    def __init__(self, wp):
+        self.walkpath = wp
+        self.navmesh = None
+
+def benchmark_actor(scene, walkpath_point):
+    act = actor.Actor.__new__(actor.Actor)
+    act.scene = scene
+    act.blocking_actions = 0
+    act.walkpath_point = walkpath_point
+    return act
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    index = int(math.ceil(p / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(0, min(index, len(sorted_values)-1))]
+
+class Workload(object):
+    def __init__(self, name):
+        self.name = name
+        self.times = []
+        self.stats = {}
+        self.failures = 0
+    
+    def run(self, func, *args):
+        start = timeit.default_timer()
+        try:
+            result = func(*args)
+        except IndexError:     # dijkstra.shortest_path on an unreachable destination
+            result = None
+        self.times.append(timeit.default_timer() - start)
+        if result is None or result is False:
+            self.failures += 1
+        return result
+    
+    def summary(self):
+        times = sorted(t * 1000.0 for t in self.times)
+        summary = {
+            'queries': len(times),
+            'p50_ms': percentile(times, 50),
+            'p90_ms': percentile(times, 90),
+            'p99_ms': percentile(times, 99),
+            'max_ms': times[-1] if times else float('nan'),
+            'no_result': self.failures,
+        }
+        if self.stats.has_key('expanded'):
+            summary['expanded_per_query'] = self.stats['expanded'] / float(max(1, len(times)))
+        return summary
+
+def run_benchmark(kind, size, num_queries, rng):
+    build_start = timeit.default_timer()
+    wp = generators[kind](size, rng)
+    build_time = timeit.default_timer() - build_start
+    identifiers = sorted(wp.points)
+    xs = [x for x, y in wp.points.viewvalues()]
+    ys = [y for x, y in wp.points.viewvalues()]
+    pairs = [(rng.choice(identifiers), rng.choice(identifiers)) for i in xrange(num_queries)]
+    clicks = [(rng.uniform(min(xs), max(xs)), rng.uniform(min(ys), max(ys)))
+              for i in xrange(num_queries)]
+    scene = BenchmarkScene(wp)
+    compact = wp.compact()
+    
+    workloads = []
+    
+    w = Workload('dijkstra.shortest_path')
+    for a, b in pairs:
+        w.run(dijkstra.shortest_path, wp.adjacency, a, b, w.stats)
+    workloads.append(w)
+    
+    w = Workload('astar on CompactGraph')
+    for a, b in pairs:
+        w.run(compact.shortest_path, a, b, w.stats)
+    workloads.append(w)
+    
+    w = Workload('WalkPath.shortest_path')
+    wp.shortest_path(pairs[0][0], pairs[0][0])  # Build derived structures up front
+    if len(wp.points) >= wp.hierarchy_threshold:
+        wp.cluster_hierarchy().update()
+    for a, b in pairs:
+        w.run(wp.shortest_path, a, b)
+    workloads.append(w)
+    
+    w = Workload('WalkPath.closest_edge_to_point')
+    for click in clicks:
+        w.run(wp.closest_edge_to_point, click)
+    workloads.append(w)
+    
+    w = Workload('Actor.closest_valid_walkpath_point')
+    for (a, b), click in zip(pairs, clicks):
+        w.run(benchmark_actor(scene, a).closest_valid_walkpath_point, *click)
+    workloads.append(w)
+    
+    w = Workload('click to path')
+    def click_to_path(act, click):
+        dest_point = act.closest_valid_walkpath_point(*click)
+        if not dest_point:
+            return None
+        return wp.move_sequence_between(act.walkpath_point, dest_point)[1]
+    wp.path_cache = {}      # Don't let the earlier workloads answer from the cache
+    for (a, b), click in zip(pairs, clicks):
+        w.run(click_to_path, benchmark_actor(scene, b), click)
+    workloads.append(w)
+    
+    return {
+        'kind': kind,
+        'size': len(wp.points),
+        'edges': len(wp.edges),
+        'build_s': build_time,
+        'workloads': [(w.name, w.summary()) for w in workloads],
+    }
+
+def print_result(result):
+    print '%s, %d points, %d edges (built in %.2fs)' % (result['kind'], result['size'],
+                                                       result['edges'], result['build_s'])
+    print '    %-36s %9s %9s %9s %9s %9s %8s' % ('', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+                                                 'expanded', 'no path')
+    for name, s in result['workloads']:
+        expanded = '%9.0f' % s['expanded_per_query'] if s.has_key('expanded_per_query') \
+                   else '%9s' % '-'
+        print '    %-36s %9.3f %9.3f %9.3f %9.3f %s %8d' % (name, s['p50_ms'], s['p90_ms'],
+                                                           s['p99_ms'], s['max_ms'],
+                                                           expanded, s['no_result'])
+    print
+    sys.stdout.flush()
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark walk path pathfinding.')
+    parser.add_argument('--sizes', default='100,1000,10000,50000',
+                        help='comma-separated numbers of points')
+    parser.add_argument('--kinds', default=','.join(sorted(generators)),
+                        help='comma-separated graph kinds: %s' % ', '.join(sorted(generators)))
+    parser.add_argument('--queries', type=int, default=100, help='queries per workload')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+    
+    rng = random.Random(args.seed)
+    results = []
+    for size in [int(s) for s in args.sizes.split(',')]:
+        for kind in args.kinds.split(','):
+            result = run_benchmark(kind, size, args.queries, rng)
+            print_result(result)
+            results.append(result)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
+
+if __name__ == '__main__':
+    main()
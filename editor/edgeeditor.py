@@ -60,6 +60,15 @@ class EdgeEditor(abstracteditor.AbstractEditor):
             draw.set_color(1,1,0,1)
             draw.rect(cp[0]-3, cp[1]-3, cp[0]+3, cp[1]+3)
             self.editor.scene.camera.unapply()
+        else:
+            # Show where a click would snap to
+            snap = self.scene.walkpath.closest_edge_points([self.editor.mouse])[0]
+            if snap:
+                cp = snap[1]
+                self.editor.scene.camera.apply()
+                draw.set_color(1,1,0,0.5)
+                draw.rect(cp[0]-2, cp[1]-2, cp[0]+2, cp[1]+2)
+                self.editor.scene.camera.unapply()
     
     def update_item_from_inspector(self, widget=None):
         if self.selected_item:
@@ -125,14 +134,18 @@ class EdgeEditor(abstracteditor.AbstractEditor):
         or vector.length_squared(vector.tuple_op(p2, midpoint_coords)) < 10:
             midpoint_coords = ((p1[0] + p2[0])/2, (p1[1] + p2[1])/2)
         midpoint = self.scene.walkpath.add_point(*vector.round_down(midpoint_coords))
-        new_item = self.selected_item
-        new_item.b = midpoint
-        self.set_selected_item(new_item)
-        new_edge = self.scene.walkpath.add_edge(midpoint, p2name, anim=self.selected_item.anim)
-        if self.selected_item.counterpart:
-            self.selected_item.counterpart.a = midpoint
-            anim = self.selected_item.counterpart.anim
+        old_item = self.selected_item
+        self.scene.walkpath.remove_edge(p1name, p2name)
+        new_item = self.scene.walkpath.add_edge(p1name, midpoint, anim=old_item.anim)
+        new_edge = self.scene.walkpath.add_edge(midpoint, p2name, anim=old_item.anim)
+        if old_item.counterpart:
+            anim = old_item.counterpart.anim
+            self.scene.walkpath.remove_edge(p2name, p1name)
+            new_cp = self.scene.walkpath.add_edge(midpoint, p1name, anim=anim)
             new_cp = self.scene.walkpath.add_edge(p2name, midpoint, anim=anim)
+        # Swap the selection directly; the inspector still describes the removed edge
+        self.selected_item = new_item
+        self.update_inspector_from_item()
     
     def make_counterpart(self, button=None):
         if not self.selected_item.counterpart:
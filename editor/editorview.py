@@ -4,7 +4,7 @@ from engine import scene, actor
 from engine import gamestate, settings
 from engine.util import draw, vector
 
-import pointeditor, actoreditor, cameraeditor, edgeeditor, pointeditor
+import pointeditor, actoreditor, cameraeditor, edgeeditor, navmesheditor, pointeditor
 import editorstate
 
 class EditorView(object):
@@ -23,18 +23,21 @@ class EditorView(object):
         self.point_ed = pointeditor.PointEditor(self)
         self.actor_ed = actoreditor.ActorEditor(self)
         self.edge_ed = edgeeditor.EdgeEditor(self)
+        self.navmesh_ed = navmesheditor.NavMeshEditor(self)
         
         self.ed_with_selection = None
         self.ed_with_drag = None
         
         self.editors = [
             # self.cam_ed, 
-            self.point_ed, self.actor_ed, self.edge_ed]
+            self.point_ed, self.actor_ed, self.navmesh_ed, self.edge_ed]
         self.windows = [self.actor_ed.actor_pallet, 
                         self.actor_ed.inspector, 
                         self.edge_ed.edge_pallet, 
                         self.edge_ed.inspector,
                         self.point_ed.inspector,
+                        self.navmesh_ed.navmesh_pallet,
+                        self.navmesh_ed.inspector,
                         # self.cam_ed.camera_pallet,
                         # self.cam_ed.inspector
                         ]
@@ -0,0 +1,109 @@
+import glydget
+
+import abstracteditor, editorstate
+from engine import gamestate
+from engine.util import draw
+
+class NavMeshEditor(abstracteditor.AbstractEditor):
+    """Edits the scene's navmesh. The selected item is a vertex, given by its coordinates."""
+    def __init__(self, ed):
+        super(NavMeshEditor, self).__init__(ed)
+        self.new_polygon_points = None
+        
+        self.navmesh_pallet = glydget.Window("Navmesh Tools", [
+            glydget.Button('New polygon', self.new_polygon),
+            glydget.Button('Delete polygon', self.delete_polygon),
+        ])
+        self.navmesh_pallet.show()
+        self.navmesh_pallet.move(gamestate.main_window.width - 2 - self.navmesh_pallet.width,
+                                 gamestate.main_window.height - 162)
+        gamestate.main_window.push_handlers(self.navmesh_pallet)
+        
+        self.vertex_x_field = glydget.Entry('', on_change=self.update_item_from_inspector)
+        self.vertex_y_field = glydget.Entry('', on_change=self.update_item_from_inspector)
+        self.inspector = glydget.Window("Navmesh Vertex Inspector", [
+            glydget.HBox([glydget.Label('x'), self.vertex_x_field], True),
+            glydget.HBox([glydget.Label('y'), self.vertex_y_field], True),
+            glydget.Button('Delete vertex', self.delete_vertex),
+        ])
+        self.inspector.move(2, gamestate.main_window.height-2)
+    
+    def wants_drag(self, x, y):
+        self.dragging_item = self.scene.navmesh.vertex_near((x, y))
+        return self.dragging_item is not None
+    
+    def start_drag(self, x, y):
+        self.drag_start = (x, y)
+        self.drag_anchor = self.dragging_item
+    
+    def continue_drag(self, x, y):
+        new_point = (int(self.drag_anchor[0] - (self.drag_start[0] - x)),
+                     int(self.drag_anchor[1] - (self.drag_start[1] - y)))
+        self.is_dragging_item = True
+        self.scene.navmesh.move_vertex(self.dragging_item, new_point)
+        self.dragging_item = new_point
+    
+    def update_item_from_inspector(self, widget=None):
+        if self.selected_item:
+            new_point = (int(self.vertex_x_field.text), int(self.vertex_y_field.text))
+            if new_point != self.selected_item:
+                self.scene.navmesh.move_vertex(self.selected_item, new_point)
+                self.selected_item = new_point
+    
+    def update_inspector_from_item(self, widget=None):
+        self.vertex_x_field.text = str(int(self.selected_item[0]))
+        self.vertex_y_field.text = str(int(self.selected_item[1]))
+    
+    def draw(self, dt=0):
+        if self.navmesh_pallet.batch:
+            self.navmesh_pallet.batch.draw()
+        if self.inspector.batch:
+            self.inspector.batch.draw()
+        
+        self.editor.scene.camera.apply()
+        self.scene.navmesh.draw()
+        if self.new_polygon_points:
+            points = self.new_polygon_points + [self.editor.mouse]
+            draw.set_color(1,1,0,1)
+            for a, b in zip(points, points[1:]):
+                draw.line(a[0], a[1], b[0], b[1])
+        if self.selected_item:
+            point = self.selected_item
+            draw.set_color(1,1,0,1)
+            draw.rect(point[0]-3, point[1]-3, point[0]+3, point[1]+3)
+        self.editor.scene.camera.unapply()
+    
+    def new_polygon(self, button=None):
+        self.new_polygon_points = []
+        def place_vertex(x, y):
+            # Snap to existing vertices so that neighboring polygons share their edges
+            point = self.scene.navmesh.vertex_near((x, y)) or (int(x), int(y))
+            points = self.new_polygon_points
+            if points and point == points[0]:
+                if len(points) >= 3:
+                    self.scene.navmesh.add_polygon(points)
+                self.new_polygon_points = None
+                editorstate.set_status_message('')
+                return
+            points.append(point)
+            self.editor.click_actions.append(place_vertex)
+        self.editor.click_actions.append(place_vertex)
+        editorstate.set_status_message('Click to place vertices, then the first one to finish')
+    
+    def delete_polygon(self, button=None):
+        def polygon_deleter(x, y):
+            index = self.scene.navmesh.polygon_at((x, y))
+            if index is not None:
+                if self.selected_item:
+                    self.editor.change_selection(None)
+                self.scene.navmesh.remove_polygon(index)
+            editorstate.set_status_message('')
+        self.editor.click_actions.append(polygon_deleter)
+        editorstate.set_status_message('Click inside a polygon to delete it')
+    
+    def delete_vertex(self, button=None):
+        if not self.selected_item:
+            return
+        vertex = self.selected_item
+        self.editor.change_selection(None)
+        self.scene.navmesh.remove_vertex(vertex)
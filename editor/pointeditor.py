@@ -41,7 +41,7 @@ class PointEditor(abstracteditor.AbstractEditor):
             new_point = (self.drag_anchor[0] - (self.drag_start[0] - x),
                          self.drag_anchor[1] - (self.drag_start[1] - y))
             self.is_dragging_item = True
-            self.scene.walkpath.points[self.dragging_item] = new_point
+            self.scene.walkpath.move_point(self.dragging_item, *new_point)
             for actor in self.scene.actors.viewvalues():
                 if actor.walkpath_point == self.dragging_item:
                     actor.sprite.position = new_point
@@ -55,23 +55,26 @@ class PointEditor(abstracteditor.AbstractEditor):
         self.placing_point = False
     
     def update_item_from_inspector(self, widget=None):
-        if self.selected_item:
-            old_identifier = self.selected_item
-            new_identifier = self.point_identifier_field.text
-            if old_identifier != new_identifier:
-                self.selected_item = new_identifier
-                for edge in self.scene.walkpath.edges.viewvalues():
-                    if edge.a == old_identifier:
-                        edge.a = new_identifier
-                    if edge.b == old_identifier:
-                        edge.b = new_identifier
-                for actor in self.scene.actors.viewvalues():
-                    if actor.walkpath_point == old_identifier:
-                        actor.walkpath_point = new_identifier
-            self.scene.walkpath.remove_point(old_identifier)
-            self.scene.walkpath.add_point(int(self.point_x_field.text), 
-                                          int(self.point_y_field.text), 
-                                          new_identifier)
+        # Called on every keystroke, so leave the walk path alone unless something changed
+        if not self.selected_item:
+            return
+        wp = self.scene.walkpath
+        old_identifier = self.selected_item
+        new_identifier = self.point_identifier_field.text
+        if old_identifier != new_identifier:
+            if not new_identifier or wp.points.has_key(new_identifier):
+                return  # Not finished typing, or the name of another point
+            wp.rename_point(old_identifier, new_identifier)
+            self.selected_item = new_identifier
+            for actor in self.scene.actors.viewvalues():
+                if actor.walkpath_point == old_identifier:
+                    actor.walkpath_point = new_identifier
+        try:
+            new_coords = (int(self.point_x_field.text), int(self.point_y_field.text))
+        except ValueError:
+            return
+        if new_coords != tuple(wp.points[new_identifier]):
+            wp.move_point(new_identifier, *new_coords)
     
     def update_inspector_from_item(self, widget=None):
         self.point_identifier_field.text = self.selected_item
@@ -106,7 +109,7 @@ class PointEditor(abstracteditor.AbstractEditor):
                     to_delete.add((a, b))
             for x in to_delete:
                 print 'deleting', x
-                del self.scene.walkpath.edges[x]
+                self.scene.walkpath.remove_edge(*x)
             editorstate.set_status_message('')
         self.editor.click_actions.append(point_deleter)
         editorstate.set_status_message("Click a point to delete it")
@@ -3,6 +3,7 @@ import os, json, collections, random
 import pyglet
 
 import actionsequencer, interpolator, util
+from util import hittest
 
 class Actor(actionsequencer.ActionSequencer):
     """Any non-static object that the player can interact with"""
@@ -11,6 +12,7 @@ class Actor(actionsequencer.ActionSequencer):
     # Can be emptied upon exiting a scene, since different actors will likely be used.
     info = None
     images = None
+    textures = None     # name: {frame name: region of a shared atlas texture}
     
     def __init__(self, identifier, name, scene, batch=None, attrs=None):
         super(Actor, self).__init__()
@@ -21,6 +23,7 @@ class Actor(actionsequencer.ActionSequencer):
         
         self.identifier = identifier
         self.walkpath_point = None
+        self.pending_walkpath_move = None
         self.resource_path = util.respath_func_with_base_path('actors', self.name)
         
         self.update_static_info()
@@ -31,11 +34,18 @@ class Actor(actionsequencer.ActionSequencer):
         self.anchor_y = Actor.info[self.name]['anchor_y']
         self.current_state = attrs.get('start_state', Actor.info[self.name]['start_state'])
         self.casts_shadow = Actor.info[self.name].get('casts_shadow', False)
+        # Merge straight runs of walk path edges into single moves, if info.json asks for it
+        self.smooth_walk = Actor.info[self.name].get('smooth_walk', False)
         
         if self.scene and batch is None:
             batch = self.scene.batch
         
-        self.sprite = pyglet.sprite.Sprite(Actor.images[self.name][self.current_state], batch=batch)
+        image = Actor.images[self.name][self.current_state]
+        if self.casts_shadow and self.scene:
+            self.sprite = hittest.TrackedShadowedSprite(image, self.scene.shadows,
+                                                        batch=batch)
+        else:
+            self.sprite = hittest.TrackedSprite(image, batch=batch)
         
         self.make_icon()
         
@@ -64,30 +74,36 @@ class Actor(actionsequencer.ActionSequencer):
     # Access
     
     dialogue_offset = property(lambda self: Actor.info[self.name].get('dialogue_offset', (0, 0)))
+    def bounding_box(self):
+        """(min x, min y, max x, max y) of the current image"""
+        img = self.current_image()
+        min_x = self.sprite.x - img.anchor_x
+        min_y = self.sprite.y - img.anchor_y
+        scale = self.sprite.scale
+        return (min_x, min_y, min_x + img.width*scale, min_y + img.height*scale)
+    
     def covers_point(self, x, y):
         if not self.sprite.visible:
             return False
-        min_x = self.abs_position_x()
-        min_y = self.abs_position_y()
-        max_x = self.abs_position_x() + self.width()
-        max_y = self.abs_position_y() + self.height()
+        min_x, min_y, max_x, max_y = self.bounding_box()
         return min_x <= x <= max_x and min_y <= y <= max_y
     
-    def icon_covers_point(self, x, y):
+    def icon_bounding_box(self):
         min_x = self.icon.x - self.icon.image.anchor_x
         min_y = self.icon.y - self.icon.image.anchor_y
-        max_x = self.icon.x - self.icon.image.anchor_x + self.icon.width
-        max_y = self.icon.y - self.icon.image.anchor_y + self.icon.height
+        return (min_x, min_y, min_x + self.icon.width, min_y + self.icon.height)
+    
+    def icon_covers_point(self, x, y):
+        min_x, min_y, max_x, max_y = self.icon_bounding_box()
         return min_x <= x <= max_x and min_y <= y <= max_y
     
     def covers_visible_point(self, x, y):
-        min_x = self.abs_position_x()
-        min_y = self.abs_position_y()
-        max_x = self.abs_position_x() + self.width()
-        max_y = self.abs_position_y() + self.height()
+        min_x, min_y, max_x, max_y = self.bounding_box()
         if min_x <= x <= max_x and min_y <= y <= max_y:
             if self.use_mask_to_detect_clicks:
-                return (util.image_alpha_at_point(self.current_image(),  x-min_x, y-min_y))
+                scale = self.sprite.scale
+                return util.mask.mask_for(self.current_image()).covers((x-min_x)/scale,
+                                                                       (y-min_y)/scale)
             else:
                 return True
     
@@ -143,13 +159,28 @@ class Actor(actionsequencer.ActionSequencer):
         interp = InterpClass(self.sprite, 'position', pos, speed=self.walk_speed, 
                              done_function=self.next_action)
         
+        self.update_state(self.walk_state(self.sprite.x, pos[0], anim))
+        self.scene.add_interpolator(interp)
+    
+    def follow_path(self, moves):
+        """Walk through a list of (pos, anim) moves with a single interpolator, switching
+        animations at each corner. See move_to for how animations are chosen."""
+        def start_segment(index, start, end):
+            self.update_state(self.walk_state(start[0], end[0], moves[index][1]))
+        interp = interpolator.PathInterpolator(self.sprite, 'position', 
+                                               [pos for pos, anim in moves],
+                                               speed=self.walk_speed,
+                                               segment_function=start_segment,
+                                               done_function=self.next_action)
+        self.scene.add_interpolator(interp)
+    
+    def walk_state(self, from_x, to_x, anim=None):
         if not anim or not Actor.images[self.name].has_key(anim):
-            if pos[0] < self.sprite.x:
+            if to_x < from_x:
                 anim = 'walk_left'
             else:
                 anim = 'walk_right'
-        self.update_state(anim)
-        self.scene.add_interpolator(interp)
+        return anim
     
     def jump(self):
         InterpClass = interpolator.JumpInterpolator # Gee golly this name is long
@@ -170,38 +201,65 @@ class Actor(actionsequencer.ActionSequencer):
         if self.blocking_actions == 0:
             if self.walkpath_point:
                 # Find the closest reachable walkpath point
-                ok = False
-                excluded_points = set()
-                dest_point = self.scene.walkpath.point_near(x, y, exclude=excluded_points)
-                while not ok:
-                    # This should never go into an infinite loop because eventually,
-                    # dest_point will just equal self.walkpath_point...
-                    try:
-                        wp = self.scene.walkpath
-                        wp.move_sequence_between(self.walkpath_point, dest_point)
-                        ok = True
-                    except IndexError:
-                        # dijkstra.py throws IndexError if no path exists
-                        # (internal heap gets over-popped)
-                        excluded_points.add(dest_point)
-                        dest_point = self.scene.walkpath.point_near(x, y, exclude=excluded_points)
-                return dest_point
+                return self.scene.walkpath.reachable_point_near(x, y, self.walkpath_point)
+            elif self.scene.navmesh:
+                # Actors not pinned to the walk path roam the navmesh, where any
+                # reachable (x, y) is a valid destination
+                return self.scene.navmesh.reachable_point_near(x, y, self.sprite.position) \
+                       or False
             else:
                 return False
         else:
             return False
     
     def prepare_walkpath_move(self, dest_point, callback=None):
-        wp = self.scene.walkpath
-        final_dest_point, moves = wp.move_sequence_between(self.walkpath_point, dest_point)
+        """dest_point is a walk path point identifier, or (x, y) on the scene's navmesh"""
+        self.pending_walkpath_move = None
+        if isinstance(dest_point, tuple):
+            final_dest_point, moves = self.scene.navmesh.move_sequence_between(
+                self.sprite.position, dest_point)
+        else:
+            wp = self.scene.walkpath
+            final_dest_point, moves = wp.move_sequence_between(self.walkpath_point, dest_point,
+                                                               smooth=self.smooth_walk)
+        self.queue_walkpath_moves(final_dest_point, moves, callback)
+    
+    def prepare_walkpath_move_async(self, dest_point, callback=None, when_ready=None):
+        """Like prepare_walkpath_move, but search on the scene's planner threads.
+        when_ready() is called from the main loop once the moves have been queued, or once
+        the request has been superseded by a newer one, so callers waiting on it go on."""
+        src_point = self.walkpath_point
+        token = object()
+        self.pending_walkpath_move = token
+        def deliver(final_dest_point, moves):
+            if self.pending_walkpath_move is token:
+                if self.walkpath_point == src_point:
+                    self.pending_walkpath_move = None
+                    self.queue_walkpath_moves(final_dest_point, moves, callback)
+                else:
+                    # The actor moved while searching, so the path starts in the wrong place
+                    self.prepare_walkpath_move(dest_point, callback)
+            if when_ready is not None:
+                when_ready()
+        if isinstance(dest_point, tuple):
+            self.scene.navmesh.move_sequence_between_async(self.scene.path_planner(),
+                                                           self.sprite.position, dest_point,
+                                                           deliver)
+        else:
+            self.scene.walkpath.move_sequence_between_async(self.scene.path_planner(), 
+                                                            src_point, dest_point, deliver,
+                                                            smooth=self.smooth_walk)
+    
+    def queue_walkpath_moves(self, final_dest_point, moves, callback=None):
         if moves:
-            for move in moves:
-                # See move_to for what these args are
-                self.actions.append([(self.move_to, move)])
-            self.walkpath_point = final_dest_point
+            self.actions.append([(self.follow_path, [moves])])
+            if isinstance(final_dest_point, tuple):
+                self.walkpath_point = None  # Free to roam the navmesh from there
+            else:
+                self.walkpath_point = final_dest_point
             info = {
                 'actor': self,
-                'point': self.walkpath_point
+                'point': final_dest_point
             }
             event_args = (util.const.WALK_PATH_COMPLETED, info)
             if callback is None:
@@ -237,16 +295,39 @@ class Actor(actionsequencer.ActionSequencer):
         if Actor.info == None or Actor.images == None:
             Actor.info = {}
             Actor.images = {}
+            Actor.textures = {}
         if not Actor.info.has_key(self.name) or not Actor.images.has_key(self.name):
             self.update_actor_info()
     
     def image_named(self, img_name, anchor_x, anchor_y):
-        """Load and anchor a PNG"""
-        img = util.load_image(self.resource_path("%s.png" % img_name))
+        """Load and anchor a PNG, taking it from this actor's atlas if it was packed"""
+        img = Actor.textures.get(self.name, {}).get(img_name)
+        if img is None:
+            img = util.load_image(self.resource_path("%s.png" % img_name))
         img.anchor_x = img.width * anchor_x
         img.anchor_y = img.height * anchor_y
         return img
     
+    def pack_frames(self, my_info):
+        """
+        Put every frame of this actor, and its icon, into shared atlas textures. Takes the
+        atlases written by AssetBuilder.py if there are any, or packs them now.
+        """
+        regions = util.assets.actor_atlases(self.name)
+        if regions is not None:
+            Actor.textures[self.name] = regions
+            return
+        images = {}
+        for name in ['icon'] + util.assets.frame_names(my_info):
+            try:
+                images[name] = util.atlas.load_image_data(self.resource_path("%s.png" % name))
+            except pyglet.resource.ResourceNotFoundException:
+                pass    # image_named reports missing frames; the icon is optional
+        Actor.textures[self.name] = util.atlas.pack(images)
+        for name, image_data in images.viewitems():
+            util.mask.set_mask(Actor.textures[self.name][name],
+                               util.mask.from_image_data(image_data))
+    
     def update_actor_info(self):
         """Update static info for this Actor in particular"""
         with pyglet.resource.file(self.resource_path('info.json'), 'r') as info_file:
@@ -254,6 +335,7 @@ class Actor(actionsequencer.ActionSequencer):
             ax, ay = my_info['anchor_x'], my_info['anchor_y']
             Actor.info[self.name] = my_info
             Actor.images[self.name] = {}
+            self.pack_frames(my_info)
             for state_name, state_info in my_info['states'].viewitems():
                 if isinstance(state_info, list):
                     num_frames = state_info[0]
@@ -212,9 +212,9 @@ class Conversation(object):
                 def callback(*args):
                     self.scene.actors['main'].next_action()
                     self.next_line()
-                self.scene.actors['main'].prepare_walkpath_move(self.convo_info['stand_at'],
-                                                                callback=callback)
-                self.scene.actors['main'].next_action()
+                main = self.scene.actors['main']
+                main.prepare_walkpath_move_async(self.convo_info['stand_at'], callback=callback,
+                                                 when_ready=main.next_action)
             else:
                 for identifier, new_state in self.animations['at_rest'].viewitems():
                     self.scene.actors[identifier].update_state(new_state)
@@ -1,62 +1,231 @@
-import os, pyglet, json
+import bisect, os, pyglet, json
 
 import gamestate, util
 
 class Environment(object):
+    """
+    Background and overlay tiles of a scene. Tiles are loaded around the camera as it moves
+    rather than all up front: the ones in view first, then a ring around them, then further
+    ahead in the direction the camera is going. A tile that isn't ready yet shows as a
+    placeholder. When the loaded tiles take more than memory_budget, the ones farthest
+    from the camera are thrown away.
+    """
+    ring = 1                # Tiles kept loaded on every side of the view
+    prefetch = 2            # More tiles loaded ahead of a moving camera
+    memory_budget = 128*1024*1024   # Bytes of tile textures to keep before evicting
+    uploads_per_frame = 2
+    placeholder_color = (16, 16, 16, 255)
+    
     def __init__(self, name, group=None):
         self.name = name
+        self.group = group
         info_path = util.respath('environments', name, 'info.json')
         with pyglet.resource.file(info_path, 'r') as info_file:
             info = json.load(info_file)
             self.background_tile_rows = info['tile_rows']
             self.background_tile_cols = info['tile_columns']
         self.background_batch = pyglet.graphics.Batch()
-        self.background_sprites = []
         self.overlay_batch = pyglet.graphics.Batch()
-        self.overlay_sprites = []
+        # Loaded tiles out of view wait here. It is never drawn, and moving a sprite between
+        # batches only copies its vertices.
+        self.offscreen_batch = pyglet.graphics.Batch()
+        self.background_tiles = {}  # (column, row): sprite, for loaded tiles only
+        self.overlay_tiles = {}
+        self.placeholders = {}      # (column, row): sprite, for visible tiles not loaded yet
+        self.missing = set()        # (kind, column, row) of tiles found not to exist
+        self.tile_bytes = {}        # (kind, column, row): texture memory of a loaded tile
+        self.visible_range = None   # (first column, last column, first row, last row)
+        self.wanted_range = None    # visible_range plus the ring and prefetched tiles
+        self.last_center = None
+        self.streamer = util.streamer.ImageStreamer()
         
-        self.width = 0
-        self.height = 0
-        background_sprites_dict = {}
-        tile_w = 0
-        tile_h = 0
-        for x in range(self.background_tile_cols):
-            this_y = 0
-            for y in range(self.background_tile_rows):
-                img = util.load_image(util.respath('environments', 
-                                                         name, 
-                                                         '%d_%d.png' % (x, y)))
-                tile_w, tile_h = img.width, img.height
-                new_sprite = pyglet.sprite.Sprite(img, x=x*tile_w, y=y*tile_h,
-                                                  batch=self.background_batch,
-                                                  group=group)
-                self.background_sprites.append(new_sprite)
-                background_sprites_dict[(x, y)] = new_sprite
-        for x in range(self.background_tile_cols):
-            self.width += background_sprites_dict[(x, 0)].width
-        for y in range(self.background_tile_rows):
-            self.height += background_sprites_dict[(0, y)].height
+        # The manifest records the tile sizes and which tiles have overlays. Without it, or
+        # if the tiles have changed since it was built, the sizes come from the PNG headers
+        # of the first row and column, and every tile is checked for an overlay as it loads.
+        layout = util.assets.environment_layout(name)
+        if self.layout_matches(layout):
+            self.column_widths = layout['column_widths']
+            self.row_heights = layout['row_heights']
+            self.overlays = set(tuple(p) for p in layout['overlays'])
+        else:
+            self.column_widths = [util.atlas.image_size(self.tile_path('background', x, 0))[0]
+                                  for x in range(self.background_tile_cols)]
+            self.row_heights = [util.atlas.image_size(self.tile_path('background', 0, y))[1]
+                                for y in range(self.background_tile_rows)]
+            self.overlays = None
+        self.column_x = [sum(self.column_widths[:x]) for x in range(self.background_tile_cols)]
+        self.row_y = [sum(self.row_heights[:y]) for y in range(self.background_tile_rows)]
+        self.width = sum(self.column_widths)
+        self.height = sum(self.row_heights)
         gamestate.camera_max = (self.width-gamestate.norm_w//2, self.height-gamestate.norm_h//2)
-        
-        for x in range(self.background_tile_cols):
-            for y in range(self.background_tile_rows):
-                overlay_tile_path = util.respath('environments', name, 'overlay_%d_%d.png' % (x, y))
-                try:
-                    img = util.load_image(overlay_tile_path)
-                    new_sprite = pyglet.sprite.Sprite(img, x=x*tile_w, y=y*tile_h,
-                                                      batch=self.overlay_batch)
-                    self.overlay_sprites.append(new_sprite)
-                except pyglet.resource.ResourceNotFoundException:
-                    pass    # Ignore if no overlay
+        self.placeholder_images = {}    # (width, height): image
         
         self.draw = self.background_batch.draw
         self.draw_overlay = self.overlay_batch.draw
         self.behind = util.load_image('environments/spacebackground.png')
     
+    def layout_matches(self, layout):
+        """True if a layout from the manifest fits the grid and the size of the first tile"""
+        if layout is None or len(layout['column_widths']) != self.background_tile_cols \
+                or len(layout['row_heights']) != self.background_tile_rows:
+            return False
+        size = util.atlas.image_size(self.tile_path('background', 0, 0))
+        return tuple(size) == (layout['column_widths'][0], layout['row_heights'][0])
+    
+    def tile_path(self, kind, x, y):
+        if kind == 'overlay':
+            return util.respath('environments', self.name, 'overlay_%d_%d.png' % (x, y))
+        return util.respath('environments', self.name, '%d_%d.png' % (x, y))
+    
+    def has_overlay(self, x, y):
+        """False if the tile is known to have no overlay"""
+        return self.overlays is None or (x, y) in self.overlays
+    
+    def placeholder_image(self, x, y):
+        size = (self.column_widths[x], self.row_heights[y])
+        if not self.placeholder_images.has_key(size):
+            pattern = pyglet.image.SolidColorImagePattern(self.placeholder_color)
+            self.placeholder_images[size] = pattern.create_image(*size)
+        return self.placeholder_images[size]
+    
+    
+    # Culling and streaming
+    
+    def tile_range(self, left, bottom, right, top):
+        """(first column, last column, first row, last row) of tiles overlapping a rectangle"""
+        return (max(0, bisect.bisect_right(self.column_x, left) - 1),
+                min(self.background_tile_cols-1, bisect.bisect_right(self.column_x, right) - 1),
+                max(0, bisect.bisect_right(self.row_y, bottom) - 1),
+                min(self.background_tile_rows-1, bisect.bisect_right(self.row_y, top) - 1))
+    
+    def cull(self, left, bottom, right, top):
+        """
+        Keep only the tiles overlapping the given rectangle in the drawn batches, and load
+        the tiles around it. Call once per frame.
+        """
+        self.streamer.poll(self.tile_loaded, self.uploads_per_frame)
+        
+        center = ((left + right) / 2.0, (bottom + top) / 2.0)
+        direction = (0, 0)
+        if self.last_center is not None:
+            direction = (cmp(center[0], self.last_center[0]), cmp(center[1], self.last_center[1]))
+        self.last_center = center
+        
+        visible_range = self.tile_range(left, bottom, right, top)
+        if visible_range == self.visible_range:
+            return
+        self.visible_range = visible_range
+        first_x, last_x, first_y, last_y = visible_range
+        self.wanted_range = (
+            max(0, first_x - self.ring - (self.prefetch if direction[0] < 0 else 0)),
+            min(self.background_tile_cols-1,
+                last_x + self.ring + (self.prefetch if direction[0] > 0 else 0)),
+            max(0, first_y - self.ring - (self.prefetch if direction[1] < 0 else 0)),
+            min(self.background_tile_rows-1,
+                last_y + self.ring + (self.prefetch if direction[1] > 0 else 0)))
+        
+        for tiles, batch in ((self.background_tiles, self.background_batch),
+                             (self.overlay_tiles, self.overlay_batch)):
+            for (x, y), sprite in tiles.iteritems():
+                new_batch = batch if self.in_range(visible_range, x, y) else self.offscreen_batch
+                if sprite.batch is not new_batch:
+                    sprite.batch = new_batch
+        self.update_placeholders()
+        self.request_tiles()
+        self.evict()
+    
+    def cull_to_camera(self, cam, x_offset=0, y_offset=0):
+        """Cull to what cam shows when the environment is drawn shifted by the offsets"""
+        x, y = cam.position
+        x -= x_offset
+        y -= y_offset
+        self.cull(x - gamestate.norm_w/2.0, y - gamestate.norm_h/2.0,
+                  x + gamestate.norm_w/2.0, y + gamestate.norm_h/2.0)
+    
+    def in_range(self, tile_range, x, y):
+        first_x, last_x, first_y, last_y = tile_range
+        return first_x <= x <= last_x and first_y <= y <= last_y
+    
+    def distance_from_view(self, x, y):
+        """Number of tiles between a tile and the visible ones"""
+        first_x, last_x, first_y, last_y = self.visible_range
+        return max(first_x - x, x - last_x, first_y - y, y - last_y, 0)
+    
+    def update_placeholders(self):
+        first_x, last_x, first_y, last_y = self.visible_range
+        for x in range(first_x, last_x+1):
+            for y in range(first_y, last_y+1):
+                if not self.background_tiles.has_key((x, y)) \
+                        and not self.placeholders.has_key((x, y)):
+                    self.placeholders[(x, y)] = pyglet.sprite.Sprite(
+                        self.placeholder_image(x, y), x=self.column_x[x], y=self.row_y[y],
+                        batch=self.background_batch, group=self.group)
+        for (x, y) in self.placeholders.keys():
+            if not self.in_range(self.visible_range, x, y):
+                self.placeholders.pop((x, y)).delete()
+    
+    def request_tiles(self):
+        """Ask for every wanted tile that isn't loaded, and drop requests no longer wanted"""
+        for key in self.streamer.pending.keys():
+            if not self.in_range(self.wanted_range, key[1], key[2]):
+                self.streamer.cancel(key)
+        first_x, last_x, first_y, last_y = self.wanted_range
+        for x in range(first_x, last_x+1):
+            for y in range(first_y, last_y+1):
+                priority = self.distance_from_view(x, y)
+                for kind, tiles in (('background', self.background_tiles),
+                                    ('overlay', self.overlay_tiles)):
+                    if kind == 'overlay' and not self.has_overlay(x, y):
+                        continue
+                    if not tiles.has_key((x, y)) and (kind, x, y) not in self.missing:
+                        self.streamer.request((kind, x, y), self.tile_path(kind, x, y),
+                                              priority, optional=(kind == 'overlay'))
+    
+    def tile_loaded(self, key, texture):
+        kind, x, y = key
+        if texture is None:
+            self.missing.add(key)
+            return
+        if self.wanted_range is None or not self.in_range(self.wanted_range, x, y):
+            return      # The camera moved on while it was loading
+        visible = self.in_range(self.visible_range, x, y)
+        if kind == 'overlay':
+            batch = self.overlay_batch if visible else self.offscreen_batch
+            self.overlay_tiles[(x, y)] = pyglet.sprite.Sprite(
+                texture, x=self.column_x[x], y=self.row_y[y], batch=batch)
+        else:
+            batch = self.background_batch if visible else self.offscreen_batch
+            self.background_tiles[(x, y)] = pyglet.sprite.Sprite(
+                texture, x=self.column_x[x], y=self.row_y[y], batch=batch, group=self.group)
+            if self.placeholders.has_key((x, y)):
+                self.placeholders.pop((x, y)).delete()
+        self.tile_bytes[key] = texture.width * texture.height * 4
+        self.evict()
+    
+    def evict(self):
+        """Unload tiles outside the wanted range, farthest first, until under memory_budget"""
+        used = sum(self.tile_bytes.itervalues())
+        if used <= self.memory_budget:
+            return
+        unwanted = [key for key in self.tile_bytes
+                    if not self.in_range(self.wanted_range, key[1], key[2])]
+        unwanted.sort(key=lambda key: -self.distance_from_view(key[1], key[2]))
+        for key in unwanted:
+            if used <= self.memory_budget:
+                return
+            kind, x, y = key
+            tiles = self.overlay_tiles if kind == 'overlay' else self.background_tiles
+            tiles.pop((x, y)).delete()
+            used -= self.tile_bytes.pop(key)
+    
     def exit(self):
-        for background_sprite in self.background_sprites:
-            background_sprite.delete()
+        self.streamer.stop()
+        for tiles in (self.background_tiles, self.overlay_tiles, self.placeholders):
+            for sprite in tiles.itervalues():
+                sprite.delete()
+            tiles.clear()
+        self.tile_bytes = {}
     
     def __repr__(self):
         return 'Environment(name="%s")' % self.name
-    
+
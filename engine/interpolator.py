@@ -127,6 +127,73 @@ class Linear2DInterpolator(Interpolator):
                       str(self.start_tuple), str(self.end_tuple), self.duration)
     
 
+class PathInterpolator(Interpolator):
+    """
+    Move a 2D attribute through a list of points at constant speed, by arc length, so
+    no time is lost at the corners. segment_function(index, start, end) is called each
+    time a new segment begins, and done_function once at the end of the whole path.
+    """
+    def __init__(self, host_object, attr_name, points, name="position", 
+                 start_tuple=None, speed=0.0, duration=0.0, 
+                 segment_function=None, done_function=None):
+        if start_tuple is None:
+            start_tuple = getattr(host_object, attr_name)
+        self.points = [tuple(start_tuple)] + [tuple(p) for p in points]
+        self.segment_function = segment_function
+        
+        # Distance along the path at which each point is reached
+        self.distances = [0.0]
+        for a, b in zip(self.points, self.points[1:]):
+            self.distances.append(self.distances[-1] + math.hypot(b[0]-a[0], b[1]-a[1]))
+        self.segment = -1
+        
+        self.speed = speed
+        self.duration = duration
+        super(PathInterpolator, self).__init__(host_object, attr_name, 
+                                               end=self.distances[-1], start=0.0, 
+                                               speed=self.speed, 
+                                               name=name, done_function=done_function,
+                                               duration=self.duration)
+        self.update(0.0)
+    
+    def update(self, dt=0):
+        super(PathInterpolator, self).update(dt)
+        if not self.host_object or len(self.points) < 2:
+            return
+        if self.duration > 0:
+            distance = self.distances[-1] * self.progress / self.duration
+        else:
+            distance = self.distances[-1]
+        
+        last_segment = len(self.points) - 2
+        segment = max(self.segment, 0)
+        while segment < last_segment and distance >= self.distances[segment+1]:
+            segment += 1
+        while self.segment < segment:
+            # Report every segment entered, even ones passed within a single update
+            self.segment += 1
+            if self.segment_function:
+                self.segment_function(self.segment, self.points[self.segment], 
+                                      self.points[self.segment+1])
+        
+        a, b = self.points[segment], self.points[segment+1]
+        seg_length = self.distances[segment+1] - self.distances[segment]
+        if seg_length > 0:
+            t = min((distance - self.distances[segment]) / seg_length, 1.0)
+        else:
+            t = 1.0
+        try:
+            setattr(self.host_object, self.attr_name, (a[0] + (b[0]-a[0])*t, 
+                                                       a[1] + (b[1]-a[1])*t))
+        except AttributeError:
+            pass
+    
+    def __repr__(self):
+        fmt = "PathInterpolator '%s' on %s.%s through %d points taking %0.2f seconds)"
+        return fmt % (self.name, str(self.host_object), self.attr_name, 
+                      len(self.points), self.duration)
+
+
 class Random2DInterpolator(Interpolator):
     def __init__(self, host_object, attr_name, magnitude, name="position", 
                  start_tuple=None, speed=0.0, duration=0.0, done_function=None):
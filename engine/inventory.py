@@ -18,6 +18,7 @@ import copy
 import json, pyglet
 
 import gamestate, util
+from util import spatial
 from interpolator import LinearInterpolator
 
 class Inventory(object):
@@ -40,6 +41,7 @@ class Inventory(object):
         self.visible = True
         
         self.items = {}
+        self.item_index = spatial.GridIndex()   # Icon bounding boxes, for clicks
         
         self.held_item = None
                 
@@ -96,6 +98,10 @@ class Inventory(object):
             leftmost_x -= sprite.width
             self.rect_left = leftmost_x-sprite.width/2-3
         self.background.x = self.rect_left-30
+        
+        self.item_index = spatial.GridIndex()
+        for item in self.items.itervalues():
+            self.item_index.insert(item, item.icon_bounding_box())
     
     #needs to go in util sometime?
     def translate_bottomleft_to_topright(self, sprites):
@@ -124,9 +130,8 @@ class Inventory(object):
         self.visibile = visibile
     
     def item_under_point(self, x, y):
-        for id, item in self.items.iteritems():
-            if item.icon_covers_point(x, y):
-                    return item
+        for item in self.item_index.keys_at((x, y)):
+            return item
         return None
     
     def intersects_active_area(self, x, y):
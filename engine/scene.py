@@ -24,6 +24,7 @@ actor_clicked(clicked_actor)
 
 import os
 import sys
+import collections
 import shutil
 import json
 import importlib
@@ -32,7 +33,7 @@ import functools
 import itertools
 
 import camera, actor, gamestate, util, interpolator, convo
-from util import walkpath, zenforcer, pushmatrix, shadow, draw
+from util import walkpath, navmesh, zenforcer, pushmatrix, shadow, draw, planner, hittest
 
 import cam, environment, gamehandler, scenehandler, sound
 
@@ -74,6 +75,7 @@ class Scene(object):
             self.main_group = None
         self.ui = ui
         self.actors = {}
+        self.hit_index = hittest.HitIndex()     # Actor bounding boxes, for clicks
         self.camera_points = {}
         self.interaction_enabled = True
         self.blackout = False
@@ -86,9 +88,10 @@ class Scene(object):
         self.y_offset = 0.0
         
         self.sound_player = sound.Sound()
-        self.shadow = shadow.ShadowManager()
+        self.shadows = shadow.ShadowSet(self.main_group)
         
         self.moving_camera = False
+        self.planner = None     # Started on first use by path_planner()
         
         self.resource_path = util.respath_func_with_base_path('game', self.name)
         
@@ -102,14 +105,10 @@ class Scene(object):
         self.load_info(load_path)
         self.initialize_from_info()
         self.load_actors()
-        self.zenforcer.init_groups()
         
         if gamestate.scripts_enabled:
             self.load_script()
         
-        for i in xrange(10):
-            self.zenforcer.update()
-        
         self.update(0)
     
     def init_convenience_bindings(self):
@@ -120,14 +119,15 @@ class Scene(object):
             if self.actors:
                 for act in self.actors.viewvalues():
                     yield act.sprite
-        sort_func = lambda a, b: a.y < b.y
-        self.zenforcer = zenforcer.ZEnforcer(self.main_group, sprite_maker, sort_func)
+        sort_key = lambda sprite: -sprite.y     # Higher on screen is farther away
+        self.zenforcer = zenforcer.ZEnforcer(self.main_group, sprite_maker, sort_key)
     
     def initialize_from_info(self):
         """Initialize objects specified in info.json"""
         self.environment_name = self.info['environment']
         self.env = environment.Environment(self.environment_name, self.main_group)
         self.walkpath = walkpath.WalkPath(dict_repr = self.info['walkpath'])
+        self.navmesh = navmesh.NavMesh(dict_repr = self.info.get('navmesh'))
         self.camera = camera.Camera(dict_repr=self.info['camera_points'])
     
     def load_actors(self):
@@ -141,19 +141,16 @@ class Scene(object):
             if attrs.has_key('walkpath_point'):
                 new_actor.walkpath_point = attrs['walkpath_point']
                 new_actor.sprite.position = self.walkpath.points[new_actor.walkpath_point]
-            self.add_actor(new_actor, reset_shadows=False)
-        self.update_shadows()
-    
-    def update_shadows(self):
-        self.shadow.set_targets([a.sprite for a in self.actors.viewvalues() if a.casts_shadow])
+            self.add_actor(new_actor, z_sort=False)
+        # Sorting every sprite at once is cheaper than placing them one at a time
+        self.zenforcer.init_groups()
     
-    def add_actor(self, actor, reset_shadows=True):
+    def add_actor(self, actor, z_sort=True):
         print "Adding actor %s" % actor.identifier
         self.actors[actor.identifier] = actor
-        self.zenforcer.init_groups()
-        self.zenforcer.update()
-        if reset_shadows:
-            self.update_shadows()
+        if z_sort:
+            self.zenforcer.add_sprite(actor.sprite)
+        self.hit_index.add(actor)
     
     def load_script(self):
         # Requires that game/scenes is in PYTHONPATH
@@ -165,7 +162,9 @@ class Scene(object):
     # Cleanup
     
     def exit(self):
-        pyglet.clock.unschedule(self.zenforcer.update)
+        if self.planner:
+            self.planner.stop()
+            self.planner = None
         for convo in self.background_convos:
             convo.stop_speaking()
         self.background_convos = None
@@ -181,17 +180,13 @@ class Scene(object):
     def __repr__(self):
         return 'Scene(name="%s")' % self.name
     
+    def path_planner(self):
+        if self.planner is None:
+            self.planner = planner.PathPlanner()
+        return self.planner
+    
     def actor_under_point(self, x, y):
-        possible_actors = {act for act in self.actors.viewvalues() 
-                            if act.covers_visible_point(x, y)}
-        try:
-            closest = possible_actors.pop()
-            for act in possible_actors:
-                if act.sprite.group > closest.sprite.group:
-                    closest = act
-            return closest
-        except KeyError:
-            return None
+        return self.hit_index.actor_at(x, y)
     
     
     # Script interaction
@@ -299,11 +294,8 @@ class Scene(object):
         if not self.interaction_enabled:
             return
         
-        clicked_actor = self.actor_under_point(*self.camera.mouse_to_canvas(x, y))
-        icon_actors = {act for act in self.ui.inventory.items.viewvalues() 
-                                                if act.icon_covers_point(x, y)}
-        if icon_actors:
-            clicked_actor = icon_actors.pop()
+        clicked_actor = self.ui.inventory.item_under_point(x, y) \
+                        or self.actor_under_point(*self.camera.mouse_to_canvas(x, y))
         
         if clicked_actor:
             self.click_actor(clicked_actor)
@@ -338,11 +330,49 @@ class Scene(object):
         if hasattr(self.module, 'filter_move'):
             dest_point = self.module.filter_move(dest_point)
             if dest_point:
-                main.prepare_walkpath_move(dest_point)
-                main.next_action()
+                main.prepare_walkpath_move_async(dest_point, when_ready=main.next_action)
         else:
-            main.prepare_walkpath_move(dest_point)
-            main.next_action()
+            main.prepare_walkpath_move_async(dest_point, when_ready=main.next_action)
+    
+    def route_actors(self, destinations, callback=None):
+        """
+        Walk many actors at once, e.g. for crowds of NPCs.
+        destinations: iterable of (actor or identifier, walkpath point or (x, y)).
+        Walk path actors starting from the same point share one search; actors off the
+        walk path are routed over the navmesh. Idle actors start moving immediately; busy
+        ones walk when their current actions finish.
+        """
+        destinations = [(act if isinstance(act, actor.Actor) else self.actors[act], dest_point)
+                        for act, dest_point in destinations]
+        # Check every destination before any actor starts moving
+        for act, dest_point in destinations:
+            if not isinstance(dest_point, tuple) and \
+                    not self.walkpath.points.has_key(dest_point):
+                raise ValueError('%s: unknown walk path point %s' % (act.identifier, dest_point))
+        
+        by_source = collections.defaultdict(list)   # (src_point, smooth): [(act, dest)]
+        for act, dest_point in destinations:
+            if not act.walkpath_point:
+                if not isinstance(dest_point, tuple):
+                    dest_point = self.walkpath.points[dest_point]
+                act.prepare_walkpath_move(dest_point, callback)
+                if not act.blocking_actions:
+                    act.next_action()
+                continue
+            if isinstance(dest_point, tuple):
+                dest_point = self.walkpath.reachable_point_near(dest_point[0], dest_point[1], 
+                                                                act.walkpath_point)
+            by_source[(act.walkpath_point, act.smooth_walk)].append((act, dest_point))
+        
+        for (src_point, smooth), group in by_source.viewitems():
+            sequences = self.walkpath.move_sequences_from(src_point, 
+                                                          [dest for act, dest in group],
+                                                          smooth=smooth)
+            for act, dest_point in group:
+                act.pending_walkpath_move = None
+                act.queue_walkpath_moves(*sequences[dest_point], callback=callback)
+                if not act.blocking_actions:
+                    act.next_action()
     
     def pause(self, show_sprites=True):
         self.paused = True
@@ -381,6 +411,8 @@ class Scene(object):
             return
         
         self.update_clock(dt)
+        if self.planner:
+            self.planner.poll()
         
         if not self.moving_camera and self.actors.has_key('main'):
             self.camera.position = self.actors["main"].sprite.position
@@ -398,9 +430,10 @@ class Scene(object):
                 self.main_group.x = self.x_offset
                 self.main_group.y = self.y_offset
             
+            self.env.cull_to_camera(self.camera, self.x_offset, self.y_offset)
             with pushmatrix(pyglet.gl.glTranslatef, self.x_offset, self.y_offset, 0):
                 self.env.draw()
-                self.shadow.draw()
+                self.shadows.flush()
                 self.batch.draw()
         
                 self.env.draw_overlay()
@@ -440,6 +473,10 @@ class Scene(object):
         """Update and return all information necessary to recreate this Scene's current state"""
         self.info['actors'] = {i: act.dict_repr() for i, act in self.actors.viewitems()}
         self.info['walkpath'] = self.walkpath.dict_repr()
+        if self.navmesh:
+            self.info['navmesh'] = self.navmesh.dict_repr()
+        else:
+            self.info.pop('navmesh', None)
         self.info['camera_points'] = self.camera.dict_repr()
         return self.info
     
@@ -452,6 +489,8 @@ class Scene(object):
     
     def save_info(self):
         shutil.copyfile(self.resource_path('info.json'), self.resource_path('info.json~'))
+        # Walk paths only change in the editor, so solve their routes now if small enough
+        self.walkpath.bake_routes()
         with pyglet.resource.file(self.resource_path('info.json'), 'w') as info_file:
             json.dump(self.dict_repr(), info_file, indent=4)
     
@@ -469,14 +508,15 @@ class Scene(object):
             new_actor.walkpath_point = kwargs['walkpath_point']
             new_actor.sprite.position = self.walkpath.points[new_actor.walkpath_point]
         self.actors[identifier] = new_actor
-        self.zenforcer.init_groups()
+        self.zenforcer.add_sprite(new_actor.sprite)
+        self.hit_index.add(new_actor)
         return new_actor
     
     def remove_actor(self, identifier):
+        self.zenforcer.remove_sprite(self.actors[identifier].sprite)
+        self.hit_index.remove(self.actors[identifier])
         self.actors[identifier].sprite.delete()
         del self.actors[identifier]
-        self.zenforcer.init_groups()
-        self.update_shadows()
     
     def load_song(self, song_name):
         self.song = pyglet.resource.media(song_name)
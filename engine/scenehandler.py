@@ -150,9 +150,8 @@ class SceneHandler(actionsequencer.ActionSequencer):
             new_scene.transition_from(self.scene.name)
             new_scene.pause(show_sprites=False)
             
-            # An ever-increasing pile of hax
-            for i in xrange(10):
-                new_scene.zenforcer.update()
+            # Paused scenes don't update, so sort sprites placed by transition_from now
+            new_scene.zenforcer.update()
             
             self.set_scenes(new_scene)
             interp = InterpClass(self.sprite, 'opacity', end=0, start=255, duration=self.fade_time,
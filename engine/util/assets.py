@@ -0,0 +1,428 @@
+"""
+Offline asset building, and the manifest that it leaves for the game.
+
+build() checks every actor, environment and scene description under the resources folder,
+packs the frames of each actor into atlas images with alpha masks for hit testing, and
+writes manifest.json next to them. The manifest lists the images the game uses, which of
+them each scene needs, where each actor frame sits in its atlas and how the tiles of each
+environment are laid out. At startup the game preloads what the manifest lists and takes
+actor frames from the prebuilt atlases instead of packing them itself.
+
+Run AssetBuilder.py after changing anything in the resources folder. Without a manifest
+the game still runs, but packs actor frames at load time and preloads nothing.
+"""
+
+import json, os
+
+import pyglet
+
+import atlas, mask, settings
+
+manifest_name = 'manifest.json'
+atlas_folder = 'build/atlases'
+
+_manifest = None
+
+def frame_names(actor_info):
+    """Names of every image an actor's info.json refers to, not counting its icon"""
+    names = []
+    for state_name, state_info in sorted(actor_info['states'].viewitems()):
+        num_frames = state_info[0] if isinstance(state_info, list) else state_info
+        if num_frames == 1:
+            names.append(state_name)
+        else:
+            names.extend("%s_%d" % (state_name, i) for i in range(1, num_frames+1))
+    return names
+
+
+# Reading the manifest
+
+def load_manifest():
+    """The manifest written by build(), or None if there isn't one. Loaded only once."""
+    global _manifest
+    if _manifest is None:
+        try:
+            with pyglet.resource.file(manifest_name, 'r') as manifest_file:
+                _manifest = json.load(manifest_file)
+        except pyglet.resource.ResourceNotFoundException:
+            _manifest = {}
+    return _manifest or None
+
+def preload_list():
+    """Every image to load before the game starts, each listed once"""
+    manifest = load_manifest()
+    if manifest is None:
+        return []
+    return manifest['preload']
+
+def environment_layout(environment_name):
+    """
+    {'column_widths': [...], 'row_heights': [...], 'overlays': [[x, y], ...]} for the
+    named environment, or None if the manifest doesn't have it
+    """
+    manifest = load_manifest()
+    if manifest is None or not manifest['environments'].has_key(environment_name):
+        return None
+    return manifest['environments'][environment_name].get('layout')
+
+def actor_atlases(actor_name):
+    """
+    {frame name: texture region} for an actor's prebuilt atlases, or None if the manifest
+    has no atlases for it
+    """
+    manifest = load_manifest()
+    if manifest is None or not manifest['actors'].has_key(actor_name):
+        return None
+    regions = {}
+    for atlas_info in manifest['actors'][actor_name]['atlases']:
+        texture = pyglet.resource.image(atlas_info['file'])
+        atlas_mask = mask.load(atlas_info['mask']) if atlas_info.has_key('mask') else None
+        for frame_name, (x, y, w, h) in atlas_info['frames'].viewitems():
+            regions[frame_name] = texture.get_region(x, y, w, h)
+            if atlas_mask is not None:
+                mask.set_mask(regions[frame_name], atlas_mask.region(x, y, w, h))
+    return regions
+
+
+# Building
+
+def _path(*args):
+    """
+    Absolute path of a resource path. Like pyglet.resource after engine.init(), this looks
+    in the resources folder and then the working directory. New files go in the former.
+    """
+    parts = '/'.join(args).split('/')
+    for root in (settings.resources_path, os.getcwd()):
+        if os.path.exists(os.path.join(root, *parts)):
+            return os.path.join(root, *parts)
+    return os.path.join(settings.resources_path, *parts)
+
+def _exists(*args):
+    return os.path.isfile(_path(*args))
+
+def _subfolders(folder):
+    names = set()
+    for root in (settings.resources_path, os.getcwd()):
+        if os.path.isdir(os.path.join(root, folder)):
+            names.update(name for name in os.listdir(os.path.join(root, folder))
+                         if os.path.isdir(os.path.join(root, folder, name)))
+    return sorted(names)
+
+def _images_in(folder):
+    """Resource paths of every PNG in folder and its subfolders"""
+    found = []
+    base = _path(folder)
+    for dir_path, dir_names, file_names in os.walk(base):
+        dir_names.sort()
+        below = os.path.relpath(dir_path, base)
+        relative = folder if below == os.curdir else '%s/%s' % (folder, below.replace(os.sep, '/'))
+        found.extend('%s/%s' % (relative, f) for f in sorted(file_names)
+                     if f.lower().endswith('.png'))
+    return found
+
+def _load_info(errors, *args):
+    """Parsed JSON at a resource path, or None after recording why it couldn't be read"""
+    path = '/'.join(args)
+    try:
+        with open(_path(path), 'r') as info_file:
+            return json.load(info_file)
+    except IOError:
+        errors.append('%s: missing' % path)
+    except ValueError, e:
+        errors.append('%s: invalid JSON (%s)' % (path, e))
+    return None
+
+def _is_number(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+def _is_count(value):
+    return isinstance(value, (int, long)) and not isinstance(value, bool) and value >= 1
+
+def check_actor(name, errors):
+    """Validate actors/<name>/info.json and its frames. Returns the info, or None."""
+    where = 'actors/%s/info.json' % name
+    info = _load_info(errors, where)
+    if not isinstance(info, dict):
+        if info is not None:
+            errors.append('%s: not an object' % where)
+        return None
+    ok = True
+    for key in ('anchor_x', 'anchor_y'):
+        if not _is_number(info.get(key)):
+            errors.append('%s: %s must be a number' % (where, key))
+            ok = False
+    states = info.get('states')
+    if not isinstance(states, dict) or not states:
+        errors.append('%s: states must be a non-empty object' % where)
+        return None
+    for state_name, state_info in sorted(states.viewitems()):
+        if _is_count(state_info):
+            continue
+        if isinstance(state_info, list) and len(state_info) == 2 \
+                and _is_count(state_info[0]) and _is_number(state_info[1]) \
+                and state_info[1] > 0:
+            continue
+        errors.append('%s: state %s must be a frame count or [frame count, seconds per frame]'
+                      % (where, state_name))
+        ok = False
+    if not states.has_key(info.get('start_state')):
+        errors.append('%s: start_state %s is not one of its states'
+                      % (where, info.get('start_state')))
+        ok = False
+    if not ok:
+        return None
+    for frame_name in frame_names(info):
+        if not _exists('actors', name, '%s.png' % frame_name):
+            errors.append('%s: frame %s.png is missing' % (where, frame_name))
+    return info
+
+def check_environment(name, errors):
+    """
+    Validate environments/<name>/info.json and its tiles. Returns {'tiles': [...],
+    'overlays': [...], 'layout': {...}}, where layout holds what Environment needs to lay
+    the tiles out without loading them: the width of each column, the height of each row
+    and the tiles that have overlays.
+    """
+    where = 'environments/%s/info.json' % name
+    info = _load_info(errors, where)
+    if info is None:
+        return None
+    if not isinstance(info, dict) or not _is_count(info.get('tile_rows')) \
+            or not _is_count(info.get('tile_columns')):
+        errors.append('%s: tile_rows and tile_columns must be positive integers' % where)
+        return None
+    tiles = []
+    overlays = []
+    overlay_tiles = []
+    column_widths = [None] * info['tile_columns']
+    row_heights = [None] * info['tile_rows']
+    for x in range(info['tile_columns']):
+        for y in range(info['tile_rows']):
+            tile = 'environments/%s/%d_%d.png' % (name, x, y)
+            if not _exists(tile):
+                errors.append('%s: tile %s is missing' % (where, tile))
+                continue
+            tiles.append(tile)
+            try:
+                with open(_path(tile), 'rb') as tile_file:
+                    w, h = atlas.png_size(tile_file)
+            except ValueError:
+                errors.append('%s: tile %s is not a PNG' % (where, tile))
+                continue
+            # Tiles are laid out in a grid, so a column's tiles must be equally wide
+            if column_widths[x] is None:
+                column_widths[x] = w
+            elif column_widths[x] != w:
+                errors.append('%s: tile %s is %d wide, unlike the rest of its column'
+                              % (where, tile, w))
+            if row_heights[y] is None:
+                row_heights[y] = h
+            elif row_heights[y] != h:
+                errors.append('%s: tile %s is %d high, unlike the rest of its row'
+                              % (where, tile, h))
+            overlay = 'environments/%s/overlay_%d_%d.png' % (name, x, y)
+            if _exists(overlay):
+                overlays.append(overlay)
+                overlay_tiles.append([x, y])
+    return {
+        'tiles': tiles,
+        'overlays': overlays,
+        'layout': {
+            'column_widths': column_widths,
+            'row_heights': row_heights,
+            'overlays': overlay_tiles,
+        },
+    }
+
+def check_scene(name, actors, environments, errors):
+    """Validate game/<name>/info.json against the checked actors and environments"""
+    where = 'game/%s/info.json' % name
+    info = _load_info(errors, where)
+    if info is None:
+        return None
+    if not isinstance(info, dict):
+        errors.append('%s: not an object' % where)
+        return None
+    for key in ('environment', 'walkpath', 'camera_points', 'actors'):
+        if not info.has_key(key):
+            errors.append('%s: %s is missing' % (where, key))
+            return None
+    if not environments.has_key(info['environment']):
+        errors.append('%s: unknown environment %s' % (where, info['environment']))
+    points = info['walkpath'].get('points', {}) if isinstance(info['walkpath'], dict) else {}
+    for identifier, attrs in sorted(info['actors'].viewitems()):
+        actor_name = attrs.get('name')
+        if not actors.has_key(actor_name):
+            errors.append('%s: actor %s uses unknown actor %s'
+                          % (where, identifier, actor_name))
+            continue
+        if attrs.has_key('start_state') \
+                and not actors[actor_name]['states'].has_key(attrs['start_state']):
+            errors.append('%s: actor %s starts in unknown state %s'
+                          % (where, identifier, attrs['start_state']))
+        if attrs.has_key('walkpath_point') and not points.has_key(attrs['walkpath_point']):
+            errors.append('%s: actor %s stands on unknown walk path point %s'
+                          % (where, identifier, attrs['walkpath_point']))
+    return info
+
+def shelf_pack(sizes, side):
+    """
+    Place as many of {name: (width, height)} as fit in a side by side square, in rows.
+    Returns {name: (x, y)} for the placed ones, with room for padding around each.
+    """
+    placed = {}
+    x = y = row_height = 0
+    for name, (w, h) in sorted(sizes.viewitems(), key=lambda item: (-item[1][1], item[0])):
+        w, h = w + atlas.padding*2, h + atlas.padding*2
+        if x + w > side:
+            x, y, row_height = 0, y + row_height, 0
+        if y + h > side or w > side:
+            continue
+        placed[name] = (x + atlas.padding, y + atlas.padding)
+        x += w
+        row_height = max(row_height, h)
+    return placed
+
+def compose(images, positions, side):
+    """A side by side RGBA image with each of images pasted at its position"""
+    pitch = side * 4
+    data = bytearray(pitch * side)
+    for name, (x, y) in positions.viewitems():
+        img = images[name]
+        row_size = img.width * 4
+        pixels = img.get_data('RGBA', row_size)
+        for row in xrange(img.height):
+            start = (y + row) * pitch + x * 4
+            data[start:start+row_size] = pixels[row*row_size:(row+1)*row_size]
+    return pyglet.image.ImageData(side, side, 'RGBA', str(data), pitch)
+
+def build_actor_atlases(name, info):
+    """
+    Write the atlas images for one actor. Returns its manifest entry: the atlases with the
+    rectangle of each frame, and any frames too big to pack.
+    """
+    images = {}
+    for frame_name in ['icon'] + frame_names(info):
+        if _exists('actors', name, '%s.png' % frame_name):
+            images[frame_name] = pyglet.image.load(_path('actors', name, '%s.png' % frame_name))
+    fits = lambda img: max(img.width, img.height) + atlas.padding*2 <= atlas.max_size
+    loose = sorted(frame_name for frame_name, img in images.viewitems() if not fits(img))
+    remaining = {frame_name: (img.width, img.height)
+                 for frame_name, img in images.viewitems() if fits(img)}
+    
+    atlases = []
+    while remaining:
+        side = atlas.atlas_side([images[frame_name] for frame_name in remaining])
+        positions = shelf_pack(remaining, side)
+        while len(positions) < len(remaining) and side < atlas.max_size:
+            side *= 2
+            positions = shelf_pack(remaining, side)
+        
+        path = '%s/%s_%d.png' % (atlas_folder, name, len(atlases))
+        atlas_image = compose(images, positions, side)
+        atlas_image.save(_path(path))
+        mask_path = '%s/%s_%d.mask' % (atlas_folder, name, len(atlases))
+        mask.save(mask.from_image_data(atlas_image), _path(mask_path))
+        atlases.append({
+            'file': path,
+            'mask': mask_path,
+            'frames': {frame_name: [x, y, images[frame_name].width, images[frame_name].height]
+                       for frame_name, (x, y) in positions.viewitems()},
+        })
+        for frame_name in positions:
+            del remaining[frame_name]
+    return {
+        'atlases': atlases,
+        'loose': ['actors/%s/%s.png' % (name, frame_name) for frame_name in loose],
+    }
+
+def _actor_files(entry):
+    return [a['file'] for a in entry['atlases']] + entry['loose']
+
+def _environment_files(entry):
+    return entry['tiles'] + entry['overlays']
+
+def build(write=True, log=None):
+    """
+    Check every asset, and unless write is False, write the atlases and the manifest.
+    Returns a list of problems found; nothing is written if there are any.
+    """
+    log = log or (lambda message: None)
+    errors = []
+    
+    actor_infos = {}
+    for name in _subfolders('actors'):
+        if _exists('actors', name, 'info.json'):
+            info = check_actor(name, errors)
+            if info is not None:
+                actor_infos[name] = info
+    log('Checked %d actors' % len(actor_infos))
+    
+    environments = {}
+    shared = []
+    for name in _subfolders('environments'):
+        if _exists('environments', name, 'info.json'):
+            entry = check_environment(name, errors)
+            if entry is not None:
+                environments[name] = entry
+        else:
+            shared.extend(_images_in('environments/%s' % name))
+    if os.path.isdir(_path('environments')):
+        shared.extend('environments/%s' % f for f in sorted(os.listdir(_path('environments')))
+                      if f.lower().endswith('.png'))
+    shared.extend(_images_in('ui'))
+    log('Checked %d environments' % len(environments))
+    
+    scene_infos = {}
+    for name in _subfolders('game'):
+        if _exists('game', name, 'info.json'):
+            info = check_scene(name, actor_infos, environments, errors)
+            if info is not None:
+                scene_infos[name] = info
+    log('Checked %d scenes' % len(scene_infos))
+    
+    if errors or not write:
+        return errors
+    
+    if not os.path.isdir(_path(atlas_folder)):
+        os.makedirs(_path(atlas_folder))
+    for old_file in os.listdir(_path(atlas_folder)):
+        if old_file.endswith('.png') or old_file.endswith('.mask'):
+            os.remove(_path(atlas_folder, old_file))
+    actors = {}
+    for name, info in sorted(actor_infos.viewitems()):
+        actors[name] = build_actor_atlases(name, info)
+        log('Packed %s into %d atlases' % (name, len(actors[name]['atlases'])))
+    
+    scenes = {}
+    for name, info in sorted(scene_infos.viewitems()):
+        files = _environment_files(environments[info['environment']])
+        for actor_name in sorted(set(attrs['name'] for attrs in info['actors'].viewvalues())):
+            files.extend(_actor_files(actors[actor_name]))
+        scenes[name] = files
+    
+    # Shared images first, then actors in the order the scenes use them, then actors no
+    # scene places (such as inventory items handed out by scripts). Environment tiles are
+    # left out; Environment streams them in around the camera.
+    preload = []
+    seen = set()
+    tiles = set(f for entry in environments.viewvalues() for f in _environment_files(entry))
+    groups = [shared] + [[f for f in scenes[name] if f not in tiles] for name in sorted(scenes)]
+    groups += [_actor_files(actors[name]) for name in sorted(actors)]
+    for files in groups:
+        for f in files:
+            if f not in seen:
+                seen.add(f)
+                preload.append(f)
+    
+    manifest = {
+        'actors': actors,
+        'environments': environments,
+        'shared': shared,
+        'scenes': scenes,
+        'preload': preload,
+    }
+    with open(_path(manifest_name), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+    log('Wrote %s with %d images to preload' % (manifest_name, len(preload)))
+    return errors
@@ -0,0 +1,81 @@
+import heapq
+
+def _count_expanded(stats, closed):
+    if stats is not None:
+        stats['expanded'] = stats.get('expanded', 0) + len(closed)
+
+def shortest_path(G, start, end, heuristic=None, stats=None):
+    """
+    Find the cheapest path from start to end in a graph of the form {a: {b: cost}}.
+    heuristic(v) must never overestimate the remaining cost from v to end.
+    Returns the list of vertices from start to end, or None if end is unreachable.
+    If stats is a dict, the number of expanded vertices is added to stats['expanded'].
+    """
+    if heuristic is None:
+        heuristic = lambda v: 0
+    
+    came_from = {start: None}
+    cost_so_far = {start: 0}
+    closed = set()
+    q = [(heuristic(start), 0, start)]    # Heap of (estimated total, cost, vertex)
+    
+    while q:
+        (estimate, cost, v1) = heapq.heappop(q)
+        if v1 in closed:
+            continue
+        if v1 == end:
+            _count_expanded(stats, closed)
+            path = []
+            while v1 is not None:
+                path.append(v1)
+                v1 = came_from[v1]
+            return path[::-1]
+        closed.add(v1)
+        neighbors = G.get(v1)
+        if not neighbors:
+            continue
+        for (v2, cost2) in neighbors.iteritems():
+            new_cost = cost + cost2
+            if v2 not in closed and new_cost < cost_so_far.get(v2, new_cost + 1):
+                cost_so_far[v2] = new_cost
+                came_from[v2] = v1
+                heapq.heappush(q, (new_cost + heuristic(v2), new_cost, v2))
+    _count_expanded(stats, closed)
+    return None
+
+def shortest_path_indexed(offsets, targets, weights, start, end, heuristic=None, stats=None):
+    """
+    A* over a CSR graph of integer vertices: the edges leaving vertex v go to
+    targets[offsets[v]:offsets[v+1]] with costs weights[offsets[v]:offsets[v+1]].
+    Returns the list of vertices from start to end, or None if end is unreachable.
+    stats works as in shortest_path.
+    """
+    if heuristic is None:
+        heuristic = lambda v: 0
+    
+    came_from = {start: -1}
+    cost_so_far = {start: 0}
+    closed = set()
+    q = [(heuristic(start), 0, start)]
+    
+    while q:
+        (estimate, cost, v1) = heapq.heappop(q)
+        if v1 in closed:
+            continue
+        if v1 == end:
+            _count_expanded(stats, closed)
+            path = []
+            while v1 != -1:
+                path.append(v1)
+                v1 = came_from[v1]
+            return path[::-1]
+        closed.add(v1)
+        for slot in xrange(offsets[v1], offsets[v1+1]):
+            v2 = targets[slot]
+            new_cost = cost + weights[slot]
+            if v2 not in closed and new_cost < cost_so_far.get(v2, new_cost + 1):
+                cost_so_far[v2] = new_cost
+                came_from[v2] = v1
+                heapq.heappush(q, (new_cost + heuristic(v2), new_cost, v2))
+    _count_expanded(stats, closed)
+    return None
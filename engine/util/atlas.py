@@ -0,0 +1,75 @@
+"""
+Packing of many images into a few shared textures.
+
+Sprites whose images share a texture can be drawn without rebinding it in between, and
+one upload replaces dozens of small ones. pyglet's resource module only packs images of
+128 pixels or less; this packs anything that fits in max_size.
+"""
+
+import struct
+
+import pyglet
+import pyglet.image.atlas
+
+# Largest atlas texture to create. Every OpenGL implementation supports at least this.
+max_size = 2048
+
+padding = 1     # Transparent pixels between packed images, so filtering doesn't bleed
+
+def load_image_data(path):
+    """Decode an image resource without uploading it to a texture"""
+    with pyglet.resource.file(path, 'rb') as image_file:
+        return pyglet.image.load(path, file=image_file)
+
+def png_size(image_file):
+    """(width, height) of an open PNG file, read from its header without decoding it"""
+    header = image_file.read(24)
+    if header[:8] != '\x89PNG\r\n\x1a\n' or header[12:16] != 'IHDR':
+        raise ValueError('not a PNG')
+    return struct.unpack('>II', header[16:24])
+
+def image_size(path):
+    """(width, height) of a PNG resource"""
+    with pyglet.resource.file(path, 'rb') as image_file:
+        return png_size(image_file)
+
+def atlas_side(images):
+    """Smallest power-of-two square side likely to hold all of images, up to max_size"""
+    area = sum(img.width * img.height for img in images)
+    largest = max([max(img.width, img.height) for img in images] or [0])
+    side = 64
+    while side < max_size and (side*side < area*1.25 or side < largest):
+        side *= 2
+    return side
+
+def padded(img):
+    """Copy of image data with a border of padding transparent pixels around it"""
+    row_size = img.width * 4
+    pitch = row_size + padding*8
+    data = bytearray(pitch * (img.height + padding*2))
+    pixels = img.get_data('RGBA', row_size)
+    for row in xrange(img.height):
+        start = (row + padding) * pitch + padding*4
+        data[start:start+row_size] = pixels[row*row_size:(row+1)*row_size]
+    return pyglet.image.ImageData(img.width + padding*2, img.height + padding*2, 'RGBA',
+                                  str(data), pitch)
+
+def pack(images):
+    """
+    Upload a dict of {name: image data} into as few textures as possible, with padding
+    around each like the atlases AssetBuilder.py writes. Returns {name: texture region}.
+    Images too big for an atlas get a texture of their own.
+    """
+    fits = lambda img: max(img.width, img.height) + padding*2 <= max_size
+    packed = {name: padded(img) for name, img in images.iteritems() if fits(img)}
+    side = atlas_side(packed.values())
+    texture_bin = pyglet.image.atlas.TextureBin(side, side)
+    textures = {}
+    # Placing tall images first leaves fewer gaps between rows
+    for name, img in sorted(images.iteritems(), key=lambda item: -item[1].height):
+        if packed.has_key(name):
+            region = texture_bin.add(packed[name])
+            textures[name] = region.get_region(padding, padding, img.width, img.height)
+        else:
+            textures[name] = img.get_texture()
+    return textures
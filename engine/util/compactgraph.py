@@ -0,0 +1,135 @@
+"""
+Immutable, integer-indexed snapshot of a WalkPath.
+
+Points are numbered, their coordinates live in flat arrays and outgoing edges are stored
+CSR-style: the edges leaving point i are targets[offsets[i]:offsets[i+1]]. Searching and
+drawing walk these arrays instead of dictionaries of string pairs, and since a snapshot
+never changes it can be shared freely (for instance with worker threads).
+"""
+
+import array, math
+
+import astar, dijkstra
+
+class CompactGraph(object):
+    def __init__(self, points, edges):
+        """points: {identifier: (x, y)}, edges: {(a, b): Edge}"""
+        self.identifiers = tuple(sorted(points.viewkeys()))
+        self.index = {identifier: i for i, identifier in enumerate(self.identifiers)}
+        self.xs = array.array('d', (points[identifier][0] for identifier in self.identifiers))
+        self.ys = array.array('d', (points[identifier][1] for identifier in self.identifiers))
+        
+        outgoing = [[] for identifier in self.identifiers]
+        for (a, b), edge in edges.viewitems():
+            if self.index.has_key(a) and self.index.has_key(b):
+                outgoing[self.index[a]].append((self.index[b], edge))
+        
+        self.offsets = array.array('l', [0])
+        self.targets = array.array('l')
+        self.weights = array.array('d')
+        self.anims = []             # Per CSR slot
+        self.two_way = array.array('b')
+        for i, out in enumerate(outgoing):
+            for j, edge in sorted(out):
+                self.targets.append(j)
+                self.weights.append(math.hypot(self.xs[j] - self.xs[i], self.ys[j] - self.ys[i]))
+                self.anims.append(edge.anim)
+                self.two_way.append(edge.counterpart is not None)
+            self.offsets.append(len(self.targets))
+        
+        self._line_vertices = None
+    
+    def __len__(self):
+        return len(self.identifiers)
+    
+    def point(self, identifier):
+        i = self.index[identifier]
+        return (self.xs[i], self.ys[i])
+    
+    def edge_slots(self):
+        """Yield (source index, CSR slot) for every edge"""
+        offsets = self.offsets
+        for i in xrange(len(self.identifiers)):
+            for slot in xrange(offsets[i], offsets[i+1]):
+                yield i, slot
+    
+    def shortest_path(self, src_point, dest_point, stats=None):
+        """List of identifiers from src_point to dest_point, or None if unreachable.
+        stats works as in astar.shortest_path."""
+        if not self.index.has_key(src_point) or not self.index.has_key(dest_point):
+            return None
+        xs, ys = self.xs, self.ys
+        end = self.index[dest_point]
+        gx, gy = xs[end], ys[end]
+        heuristic = lambda i: math.hypot(xs[i] - gx, ys[i] - gy)
+        path = astar.shortest_path_indexed(self.offsets, self.targets, self.weights,
+                                           self.index[src_point], end, heuristic, stats)
+        if path is None:
+            return None
+        return [self.identifiers[i] for i in path]
+    
+    def shortest_paths_from(self, src_point, dest_points):
+        """Shortest paths from src_point to each of dest_points, found with a single search.
+        Returns {dest: list of identifiers, or None if unreachable}."""
+        results = dict.fromkeys(dest_points)
+        if not self.index.has_key(src_point):
+            return results
+        ends = [self.index[dest] for dest in results if self.index.has_key(dest)]
+        settled = dijkstra.settle_indexed(self.offsets, self.targets, self.weights,
+                                          self.index[src_point], ends)
+        for dest in results:
+            v = self.index.get(dest)
+            if v is None or not settled.has_key(v):
+                continue
+            path = []
+            while v != -1:
+                path.append(self.identifiers[v])
+                v = settled[v]
+            results[dest] = path[::-1]
+        return results
+    
+    def anim_between(self, a, b):
+        """Animation of the edge from index a to index b"""
+        for slot in xrange(self.offsets[a], self.offsets[a+1]):
+            if self.targets[slot] == b:
+                return self.anims[slot]
+        raise KeyError((self.identifiers[a], self.identifiers[b]))
+    
+    def move_sequence_between(self, src_point, dest_point):
+        """Same as WalkPath.move_sequence_between, answered from this snapshot"""
+        path = self.shortest_path(src_point, dest_point)
+        if path is None:
+            return dest_point, None
+        indices = [self.index[identifier] for identifier in path]
+        move_dests = []
+        for a, b in zip(indices, indices[1:]):
+            move_dests.append(((self.xs[b], self.ys[b]), self.anim_between(a, b)))
+        return dest_point, move_dests
+    
+    def line_vertices(self):
+        """Flat [x1, y1, x2, y2, ...] of every edge and a matching flat RGBA color list"""
+        if self._line_vertices is None:
+            vertices = []
+            colors = []
+            for i, slot in self.edge_slots():
+                j = self.targets[slot]
+                vertices.extend((self.xs[i], self.ys[i], self.xs[j], self.ys[j]))
+                if self.two_way[slot]:
+                    colors.extend((0, 255, 0, 255, 0, 255, 0, 255))
+                else:
+                    colors.extend((255, 0, 0, 255, 0, 0, 255, 255))
+            self._line_vertices = (vertices, colors)
+        return self._line_vertices
+    
+    def dict_repr(self):
+        """Same format as WalkPath.dict_repr(), so a WalkPath can be rebuilt from it"""
+        number = lambda v: int(v) if v == int(v) else v
+        points = {identifier: {'x': number(self.xs[i]), 'y': number(self.ys[i])}
+                  for i, identifier in enumerate(self.identifiers)}
+        edges = []
+        for i, slot in self.edge_slots():
+            edge_dict = {'a': self.identifiers[i], 'b': self.identifiers[self.targets[slot]]}
+            if self.anims[slot]:
+                edge_dict['anim'] = self.anims[slot]
+            edges.append(edge_dict)
+        return {'points': points, 'edges': edges}
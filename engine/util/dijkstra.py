@@ -1,6 +1,7 @@
 import heapq
 
-def shortest_path(G, start, end):
+def shortest_path(G, start, end, stats=None):
+    """If stats is a dict, the number of expanded vertices is added to stats['expanded']"""
     def flatten(L):       # Flatten linked list of form [0,[1,[2,[]]]]
         while len(L) > 0:
             yield L[0]
@@ -9,16 +10,65 @@ def shortest_path(G, start, end):
     q = [(0, start, ())]  # Heap of (cost, path_head, path_rest).
     visited = set()       # Visited vertices.
        
-    #try:
-    while True:
-        (cost, v1, path) = heapq.heappop(q)
+    try:
+        while True:
+            (cost, v1, path) = heapq.heappop(q)
+            if v1 not in visited:
+                visited.add(v1)
+                if v1 == end:
+                    return list(flatten(path))[::-1] + [v1]
+                path = (v1, path)
+                for (v2, cost2) in G[v1].iteritems():
+                    if v2 not in visited:
+                        heapq.heappush(q, (cost + cost2, v2, path))
+    finally:
+        if stats is not None:
+            stats['expanded'] = stats.get('expanded', 0) + len(visited)
+
+def single_source(G, start):
+    """
+    Solve shortest paths from start to every reachable vertex.
+    Returns {vertex: (first vertex after start on the path, total cost)}.
+    """
+    q = [(0, start, None)]  # Heap of (cost, vertex, first hop used to get there)
+    visited = set()
+    routes = {}
+    
+    while q:
+        (cost, v1, first_hop) = heapq.heappop(q)
         if v1 not in visited:
             visited.add(v1)
-            if v1 == end:
-                return list(flatten(path))[::-1] + [v1]
-            path = (v1, path)
-            for (v2, cost2) in G[v1].iteritems():
+            if first_hop is not None:
+                routes[v1] = (first_hop, cost)
+            for (v2, cost2) in G.get(v1, {}).iteritems():
                 if v2 not in visited:
-                    heapq.heappush(q, (cost + cost2, v2, path))
-    #except IndexError:
-    #    raise Exception('No path found between %s and %s' % (start, end))
\ No newline at end of file
+                    hop = v2 if first_hop is None else first_hop
+                    heapq.heappush(q, (cost + cost2, v2, hop))
+    return routes
+
+def settle_indexed(offsets, targets, weights, start, ends):
+    """
+    Dijkstra over a CSR graph of integer vertices (see astar.shortest_path_indexed),
+    stopping as soon as every vertex in ends has been settled.
+    Returns {settled vertex: previous vertex on its shortest path}, with -1 for start.
+    """
+    remaining = set(ends)
+    came_from = {start: -1}
+    settled = {}
+    cost_so_far = {start: 0}
+    q = [(0, start)]
+    
+    while q and remaining:
+        (cost, v1) = heapq.heappop(q)
+        if v1 in settled:
+            continue
+        settled[v1] = came_from[v1]
+        remaining.discard(v1)
+        for slot in xrange(offsets[v1], offsets[v1+1]):
+            v2 = targets[slot]
+            new_cost = cost + weights[slot]
+            if v2 not in settled and new_cost < cost_so_far.get(v2, new_cost + 1):
+                cost_so_far[v2] = new_cost
+                came_from[v2] = v1
+                heapq.heappush(q, (new_cost, v2))
+    return settled
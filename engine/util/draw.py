@@ -20,6 +20,17 @@ def line(x1, y1, x2, y2, colors=None):
     else:
         pyglet.graphics.draw(2, pyglet.gl.GL_LINES, ('v2f', (x1, y1, x2, y2)), ('c4f', colors))
 
+def lines(points, colors=None):
+    """
+    Draw many separate line segments in one call.
+    @param points: A list formatted like [ax1, ay1, bx1, by1, ax2, ay2...]
+    @param colors: A list formatted like [r1, g1, b1, a1, r2, g2, b2 a2...]
+    """
+    if colors is None:
+        pyglet.graphics.draw(len(points)/2, pyglet.gl.GL_LINES, ('v2f', points))
+    else:
+        pyglet.graphics.draw(len(points)/2, pyglet.gl.GL_LINES, ('v2f', points), ('c4f', colors))
+
 def line_loop(points, colors=None):
     """
     @param points: A list formatted like [x1, y1, x2, y2...]
@@ -33,6 +44,13 @@ def line_loop(points, colors=None):
 def rect(x1, y1, x2, y2):
     pyglet.graphics.draw(4, pyglet.gl.GL_QUADS, ('v2f', (x1, y1, x1, y2, x2, y2, x2, y1)))
 
+def rects(boxes):
+    """Draw many rectangles, given as (x1, y1, x2, y2) tuples, in one call"""
+    if not boxes:
+        return
+    points = _concat((x1, y1, x1, y2, x2, y2, x2, y1) for x1, y1, x2, y2 in boxes)
+    pyglet.graphics.draw(len(points)/2, pyglet.gl.GL_QUADS, ('v2f', points))
+
 def rect_outline(x1, y1, x2, y2):
     if x1 > x2: x1, x2 = x2, x1
     if y1 > y2: y1, y2 = y2, y1
@@ -0,0 +1,80 @@
+"""
+Array-backed store of line segments for answering many nearest-point queries at once.
+
+Uses NumPy when it is installed and falls back to plain Python otherwise.
+"""
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Largest number of (query, edge) pairs evaluated in one NumPy step
+chunk_size = 1 << 20
+
+class EdgeArray(object):
+    def __init__(self, keys, starts, ends):
+        """keys[i] names the segment from starts[i] to ends[i]"""
+        self.keys = list(keys)
+        if numpy is not None:
+            starts = numpy.array(starts, dtype=float).reshape(-1, 2)
+            ends = numpy.array(ends, dtype=float).reshape(-1, 2)
+            self.ax, self.ay = starts[:,0], starts[:,1]
+            self.dx, self.dy = ends[:,0] - self.ax, ends[:,1] - self.ay
+            self.length_squared = self.dx*self.dx + self.dy*self.dy
+            # Degenerate segments project everything onto their start point
+            self.inv_length_squared = numpy.where(self.length_squared > 0,
+                1.0/numpy.maximum(self.length_squared, 1e-12), 0.0)
+        else:
+            self.ax = [float(p[0]) for p in starts]
+            self.ay = [float(p[1]) for p in starts]
+            self.dx = [e[0] - s[0] for s, e in zip(starts, ends)]
+            self.dy = [e[1] - s[1] for s, e in zip(starts, ends)]
+            self.length_squared = [dx*dx + dy*dy for dx, dy in zip(self.dx, self.dy)]
+    
+    def __len__(self):
+        return len(self.keys)
+    
+    def closest(self, points):
+        """
+        For each query point, find the nearest segment.
+        Returns a list of (key, closest point on segment, squared distance), one per point.
+        """
+        if not self.keys:
+            return [None for p in points]
+        if numpy is not None:
+            return self._closest_numpy(points)
+        return [self._closest_python(p) for p in points]
+    
+    def _closest_numpy(self, points):
+        points = numpy.array(points, dtype=float).reshape(-1, 2)
+        results = []
+        rows_per_chunk = max(1, chunk_size // len(self.keys))
+        for start in xrange(0, len(points), rows_per_chunk):
+            px = points[start:start+rows_per_chunk, 0:1]
+            py = points[start:start+rows_per_chunk, 1:2]
+            t = ((px - self.ax)*self.dx + (py - self.ay)*self.dy) * self.inv_length_squared
+            numpy.clip(t, 0.0, 1.0, out=t)
+            cx = self.ax + t*self.dx
+            cy = self.ay + t*self.dy
+            dist_squared = (px - cx)**2 + (py - cy)**2
+            for row, i in enumerate(dist_squared.argmin(axis=1)):
+                results.append((self.keys[i], (float(cx[row, i]), float(cy[row, i])),
+                                float(dist_squared[row, i])))
+        return results
+    
+    def _closest_python(self, point):
+        px, py = point
+        best = None
+        for i in xrange(len(self.keys)):
+            ax, ay, dx, dy = self.ax[i], self.ay[i], self.dx[i], self.dy[i]
+            length_squared = self.length_squared[i]
+            if length_squared > 0:
+                t = min(max(((px - ax)*dx + (py - ay)*dy) / length_squared, 0.0), 1.0)
+            else:
+                t = 0.0
+            cx, cy = ax + t*dx, ay + t*dy
+            dist_squared = (px - cx)*(px - cx) + (py - cy)*(py - cy)
+            if best is None or dist_squared < best[2]:
+                best = (self.keys[i], (cx, cy), dist_squared)
+        return best
@@ -0,0 +1,187 @@
+"""
+Two-level search for very large walk paths.
+
+Points are grouped into square clusters. A point with an edge to or from another cluster
+is a portal. The abstract graph joins the portals of each cluster by their shortest
+distance inside the cluster, plus the edges that cross between clusters. A search runs on
+the abstract graph first and is then refined into real points one cluster at a time.
+
+Changing a point or edge only marks the clusters involved as dirty; they are rebuilt the
+next time a path is requested.
+"""
+
+import collections, math
+
+import astar, dijkstra
+
+class _Overlay(object):
+    """Read-only graph that shadows some vertices of a base graph"""
+    def __init__(self, overlay, base):
+        self.overlay = overlay
+        self.base = base
+    
+    def get(self, v, default=None):
+        if v in self.overlay:
+            return self.overlay[v]
+        return self.base.get(v, default)
+
+
+class ClusterHierarchy(object):
+    def __init__(self, walkpath, cluster_size=512):
+        self.walkpath = walkpath
+        self.cluster_size = cluster_size
+        
+        self.point_cluster = {}                             # identifier: cluster
+        self.cluster_points = collections.defaultdict(set)  # cluster: identifiers
+        self.local = {}         # cluster: {a: {b: cost}} for edges inside the cluster
+        self.portals = {}       # cluster: set of portal identifiers
+        self.abstract = {}      # portal: {portal: cost}
+        self.dirty = set()
+        
+        for identifier in walkpath.points.keys():
+            self.point_changed(identifier)
+    
+    def cluster_of(self, coords):
+        return (int(coords[0] // self.cluster_size), int(coords[1] // self.cluster_size))
+    
+    def _neighbors(self, identifier):
+        """Identifiers joined to identifier by an edge in either direction"""
+        for a, b in self.walkpath.point_edges.get(identifier, ()):
+            yield b if a == identifier else a
+    
+    # Change notifications from the WalkPath
+    
+    def point_changed(self, identifier):
+        old_cluster = self.point_cluster.pop(identifier, None)
+        if old_cluster is not None:
+            self.cluster_points[old_cluster].discard(identifier)
+            self.dirty.add(old_cluster)
+        if self.walkpath.points.has_key(identifier):
+            new_cluster = self.cluster_of(self.walkpath.points[identifier])
+            self.point_cluster[identifier] = new_cluster
+            self.cluster_points[new_cluster].add(identifier)
+            self.dirty.add(new_cluster)
+        # Neighbors may have gained or lost portal status or edge lengths
+        for neighbor in self._neighbors(identifier):
+            if self.point_cluster.has_key(neighbor):
+                self.dirty.add(self.point_cluster[neighbor])
+    
+    def edge_changed(self, a, b):
+        for identifier in (a, b):
+            if self.point_cluster.has_key(identifier):
+                self.dirty.add(self.point_cluster[identifier])
+    
+    # Rebuilding
+    
+    def update(self):
+        for cluster in self.dirty:
+            self._rebuild(cluster)
+        self.dirty = set()
+    
+    def _rebuild(self, cluster):
+        adjacency = self.walkpath.adjacency
+        point_cluster = self.point_cluster
+        for portal in self.portals.pop(cluster, ()):
+            # Leave portals that have moved to another cluster to that cluster's rebuild
+            if point_cluster.get(portal, cluster) == cluster:
+                self.abstract.pop(portal, None)
+        
+        members = self.cluster_points.get(cluster)
+        if not members:
+            self.cluster_points.pop(cluster, None)
+            self.local.pop(cluster, None)
+            return
+        
+        local = {}
+        portals = set()
+        for p in members:
+            local[p] = {q: cost for q, cost in adjacency.get(p, {}).iteritems()
+                        if point_cluster.get(q) == cluster}
+            for q in self._neighbors(p):
+                if point_cluster.has_key(q) and point_cluster[q] != cluster:
+                    portals.add(p)
+                    break
+        self.local[cluster] = local
+        self.portals[cluster] = portals
+        
+        for p in portals:
+            routes = dijkstra.single_source(local, p)
+            edges = {q: routes[q][1] for q in portals if routes.has_key(q)}
+            for q, cost in adjacency.get(p, {}).iteritems():
+                if point_cluster.get(q, cluster) != cluster:
+                    edges[q] = cost
+            self.abstract[p] = edges
+    
+    # Searching
+    
+    def far_apart(self, src_point, dest_point):
+        """
+        True unless the points are in the same or neighboring clusters. Searching through
+        the portals only pays off between points farther apart than that.
+        """
+        if not self.point_cluster.has_key(src_point) or \
+                not self.point_cluster.has_key(dest_point):
+            return False
+        (sx, sy), (dx, dy) = self.point_cluster[src_point], self.point_cluster[dest_point]
+        return max(abs(sx - dx), abs(sy - dy)) > 1
+    
+    def shortest_path(self, src_point, dest_point):
+        """List of identifiers from src_point to dest_point, or None if unreachable.
+        Paths that leave the starting cluster are near-optimal rather than optimal."""
+        self.update()
+        if not self.point_cluster.has_key(src_point) or \
+                not self.point_cluster.has_key(dest_point):
+            return None
+        if src_point == dest_point:
+            return [src_point]
+        
+        points = self.walkpath.points
+        goal = points[dest_point]
+        heuristic = lambda v: math.hypot(points[v][0] - goal[0], points[v][1] - goal[1])
+        src_cluster = self.point_cluster[src_point]
+        dest_cluster = self.point_cluster[dest_point]
+        
+        if src_cluster == dest_cluster:
+            path = astar.shortest_path(self.local[src_cluster], src_point, dest_point, heuristic)
+            if path is not None:
+                return path
+        
+        # Temporarily join src_point to the portals of its cluster, and those of
+        # dest_point's cluster to dest_point
+        overlay = {}
+        src_routes = dijkstra.single_source(self.local[src_cluster], src_point)
+        overlay[src_point] = dict(self.abstract.get(src_point, {}))
+        for portal in self.portals[src_cluster]:
+            if src_routes.has_key(portal):
+                overlay[src_point][portal] = src_routes[portal][1]
+        
+        reverse = collections.defaultdict(dict)
+        for a, out in self.local[dest_cluster].iteritems():
+            for b, cost in out.iteritems():
+                reverse[b][a] = cost
+        dest_routes = dijkstra.single_source(reverse, dest_point)
+        for portal in self.portals[dest_cluster]:
+            if dest_routes.has_key(portal):
+                if not overlay.has_key(portal):
+                    overlay[portal] = dict(self.abstract.get(portal, {}))
+                overlay[portal][dest_point] = dest_routes[portal][1]
+        
+        abstract_path = astar.shortest_path(_Overlay(overlay, self.abstract),
+                                            src_point, dest_point, heuristic)
+        if abstract_path is None:
+            return None
+        return self._refine(abstract_path)
+    
+    def _refine(self, abstract_path):
+        """Expand consecutive abstract nodes in the same cluster into real paths"""
+        points = self.walkpath.points
+        path = [abstract_path[0]]
+        for a, b in zip(abstract_path, abstract_path[1:]):
+            cluster = self.point_cluster[a]
+            if cluster == self.point_cluster[b]:
+                goal = points[b]
+                heuristic = lambda v: math.hypot(points[v][0] - goal[0], points[v][1] - goal[1])
+                path.extend(astar.shortest_path(self.local[cluster], a, b, heuristic)[1:])
+            else:
+                path.append(b)
+        return path
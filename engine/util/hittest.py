@@ -0,0 +1,58 @@
+"""
+Finding the actor under a point without testing every actor in the scene.
+
+Actor sprites are TrackedSprites, which report every change of position, image, scale or
+visibility. A HitIndex keeps the bounding box of each actor in a GridIndex as they change,
+so a click only tests the few actors whose boxes contain it against their alpha masks.
+"""
+
+import functools
+
+import pyglet
+
+import shadow, spatial
+
+class TrackedSprite(pyglet.sprite.Sprite):
+    """Sprite that calls on_change() after anything that moves its vertices"""
+    on_change = None
+    
+    def _update_position(self):
+        super(TrackedSprite, self)._update_position()
+        if self.on_change is not None:
+            self.on_change()
+
+
+class TrackedShadowedSprite(TrackedSprite, shadow.ShadowedSprite):
+    pass
+
+
+class HitIndex(object):
+    def __init__(self, cell_size=128):
+        self.grid = spatial.GridIndex(cell_size)
+    
+    def __len__(self):
+        return len(self.grid)
+    
+    def add(self, act):
+        """Start tracking an actor whose sprite is a TrackedSprite"""
+        act.sprite.on_change = functools.partial(self.update, act)
+        self.update(act)
+    
+    def remove(self, act):
+        act.sprite.on_change = None
+        self.grid.remove(act)
+    
+    def update(self, act):
+        box = act.bounding_box()
+        if self.grid.boxes.get(act) != box:
+            self.grid.insert(act, box)
+    
+    def actor_at(self, x, y):
+        """The frontmost actor with a visible pixel at (x, y), or None"""
+        closest = None
+        for act in self.grid.keys_at((x, y)):
+            if closest is not None and not act.sprite.group > closest.sprite.group:
+                continue
+            if act.covers_visible_point(x, y):
+                closest = act
+        return closest
@@ -0,0 +1,94 @@
+"""
+Alpha masks for hit testing.
+
+Reading a pixel back from a texture copies the whole texture out of video memory, and for
+frames packed into an atlas that is the whole atlas. An AlphaMask keeps one bit per pixel
+in main memory instead, set where the image isn't fully transparent, so testing a point
+only indexes a byte. Masks are made once per image, from the decoded image data when it
+is at hand or from the file AssetBuilder.py writes next to each atlas.
+"""
+
+import struct
+
+import pyglet
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+_masks = {}     # image: AlphaMask
+
+# Maps each alpha value to the bit it packs to
+_bit_chars = ''.join('0' if i == 0 else '1' for i in xrange(256))
+
+class AlphaMask(object):
+    """
+    One bit per pixel of a width by height image, rows from the bottom up like pyglet's
+    image data, with the first pixel of each byte in its highest bit. A mask can be a
+    region of a larger one, such as a frame of an atlas, sharing its bits.
+    """
+    def __init__(self, width, height, bits, row_bytes=None, x=0, y=0):
+        self.width = width
+        self.height = height
+        self.bits = bits
+        self.row_bytes = row_bytes or (width + 7) // 8
+        self.x = x
+        self.y = y
+    
+    def covers(self, x, y):
+        """True if the pixel at (x, y), counted from the bottom left, isn't transparent"""
+        x, y = int(x), int(y)
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return False
+        x += self.x
+        return bool(self.bits[(y + self.y) * self.row_bytes + (x >> 3)] & (0x80 >> (x & 7)))
+    
+    def region(self, x, y, width, height):
+        return AlphaMask(width, height, self.bits, self.row_bytes, self.x + x, self.y + y)
+
+
+def from_rgba(width, height, data):
+    """Mask of RGBA pixel data with a pitch of width*4"""
+    alpha = str(data)[3::4]
+    row_bytes = (width + 7) // 8
+    if numpy is not None:
+        opaque = numpy.frombuffer(alpha, numpy.uint8).reshape(height, width) > 0
+        return AlphaMask(width, height, bytearray(numpy.packbits(opaque, axis=1).tostring()))
+    chars = alpha.translate(_bit_chars)
+    padding = '0' * (row_bytes*8 - width)
+    rows = []
+    for y in xrange(height):
+        row = int(chars[y*width:(y+1)*width] + padding, 2)
+        rows.append(('%0*x' % (row_bytes*2, row)).decode('hex'))
+    return AlphaMask(width, height, bytearray(''.join(rows)))
+
+def from_image_data(image_data):
+    return from_rgba(image_data.width, image_data.height,
+                     image_data.get_data('RGBA', image_data.width*4))
+
+def save(alpha_mask, path):
+    """Write a whole mask (not a region) to a file"""
+    with open(path, 'wb') as mask_file:
+        mask_file.write(struct.pack('>4sII', 'MASK', alpha_mask.width, alpha_mask.height))
+        mask_file.write(str(alpha_mask.bits))
+
+def load(path):
+    """Read a mask written by save() from a resource"""
+    with pyglet.resource.file(path, 'rb') as mask_file:
+        magic, width, height = struct.unpack('>4sII', mask_file.read(12))
+        if magic != 'MASK':
+            raise ValueError('%s is not a mask' % path)
+        return AlphaMask(width, height, bytearray(mask_file.read()))
+
+
+# Cache
+
+def set_mask(img, alpha_mask):
+    _masks[img] = alpha_mask
+
+def mask_for(img):
+    """The mask of an image or texture region, read back from the texture only once"""
+    if not _masks.has_key(img):
+        _masks[img] = from_image_data(img.get_image_data())
+    return _masks[img]
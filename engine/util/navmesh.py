@@ -0,0 +1,360 @@
+"""
+Walkable areas described by polygons instead of a graph of points.
+
+Each polygon is split into triangles by ear clipping. Triangles that share a whole edge
+(both end points at the same coordinates, also across polygons) are neighbors. Paths are
+found with A* over the triangles and then pulled tight with the funnel algorithm, so they
+run straight across open floor and bend only at corners.
+
+Moves are (x, y) tuples rather than walk path point identifiers, and every path comes back
+as a list of coordinates starting at the source.
+"""
+
+import math
+
+import astar, draw, spatial, vector
+
+def _area2(a, b, c):
+    """Twice the signed area of triangle abc, positive when c is left of a->b"""
+    return (b[0]-a[0])*(c[1]-a[1]) - (c[0]-a[0])*(b[1]-a[1])
+
+def _strictly_inside(p, a, b, c):
+    """True if p lies inside the counterclockwise triangle abc and not on its border"""
+    return _area2(a, b, p) > 0 and _area2(b, c, p) > 0 and _area2(c, a, p) > 0
+
+def _closest_point_on_segment(point, a, b):
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length_squared = dx*dx + dy*dy
+    if length_squared == 0:
+        return a
+    t = ((point[0] - a[0])*dx + (point[1] - a[1])*dy) / float(length_squared)
+    t = min(max(t, 0.0), 1.0)
+    return (a[0] + t*dx, a[1] + t*dy)
+
+def triangulate(polygon):
+    """
+    Split a simple polygon, given as a list of (x, y) in either winding, into
+    counterclockwise triangles. Degenerate slivers are dropped.
+    """
+    points = []
+    for p in polygon:
+        p = tuple(p)
+        if not points or points[-1] != p:
+            points.append(p)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if len(points) < 3:
+        return []
+    
+    area = sum(_area2((0, 0), points[i-1], points[i]) for i in xrange(len(points)))
+    if area < 0:
+        points.reverse()
+    
+    triangles = []
+    remaining = points
+    while len(remaining) > 3:
+        for i in xrange(len(remaining)):
+            a, b, c = remaining[i-1], remaining[i], remaining[(i+1) % len(remaining)]
+            if _area2(a, b, c) <= 0:
+                continue    # Reflex or flat corner
+            if any(_strictly_inside(p, a, b, c) for p in remaining if p not in (a, b, c)):
+                continue
+            triangles.append((a, b, c))
+            remaining = remaining[:i] + remaining[i+1:]
+            break
+        else:
+            break   # Self-intersecting polygon; keep what has been clipped so far
+    if len(remaining) == 3 and _area2(*remaining) > 0:
+        triangles.append(tuple(remaining))
+    return triangles
+
+
+class NavMesh(object):
+    def __init__(self, dict_repr=None, cell_size=128):
+        self.polygons = []      # Lists of (x, y) as authored
+        self.cell_size = cell_size
+        self.dirty = True
+        
+        # Rebuilt from the polygons by update()
+        self.triangles = []     # Counterclockwise (a, b, c)
+        self.owners = []        # Per triangle: index of the polygon it came from
+        self.graph = {}         # triangle: {neighbor triangle: cost}
+        self.portals = {}       # (triangle, neighbor): (left, right) end points of the shared edge
+        self.components = []    # Per triangle: connected component number
+        self.centroids = []
+        self.triangle_index = spatial.GridIndex(cell_size)
+        self._snapshot = None   # NavMeshSnapshot of the above, made on demand
+        
+        if dict_repr:
+            for polygon in dict_repr['polygons']:
+                self.polygons.append([tuple(p) for p in polygon])
+    
+    def __len__(self):
+        return len(self.polygons)
+    
+    
+    # Editing
+    
+    def add_polygon(self, points):
+        self.polygons.append([tuple(p) for p in points])
+        self.dirty = True
+        return len(self.polygons) - 1
+    
+    def remove_polygon(self, index):
+        del self.polygons[index]
+        self.dirty = True
+    
+    def move_vertex(self, old_coords, new_coords):
+        """Move every polygon vertex at old_coords, keeping shared edges shared"""
+        new_coords = tuple(new_coords)
+        for polygon in self.polygons:
+            for i, p in enumerate(polygon):
+                if p == old_coords:
+                    polygon[i] = new_coords
+        self.dirty = True
+    
+    def remove_vertex(self, coords):
+        """Remove every polygon vertex at coords, and polygons left with fewer than 3"""
+        self.polygons = [[p for p in polygon if p != coords] for polygon in self.polygons]
+        self.polygons = [polygon for polygon in self.polygons if len(polygon) >= 3]
+        self.dirty = True
+    
+    def vertex_near(self, point, radius=10):
+        best = None
+        best_dist = radius*radius
+        for polygon in self.polygons:
+            for p in polygon:
+                dist = vector.length_squared(vector.tuple_op(p, point))
+                if dist <= best_dist:
+                    best, best_dist = p, dist
+        return best
+    
+    def polygon_at(self, point):
+        """Index of the polygon containing point, or None"""
+        triangle = self.locate(point)
+        if triangle is None:
+            return None
+        return self.owners[triangle]
+    
+    
+    # Rebuilding
+    
+    def update(self):
+        """Rebuild the triangles and their connections if the polygons have changed"""
+        if not self.dirty:
+            return
+        self.dirty = False
+        self._snapshot = None
+        self.triangles = []
+        self.owners = []
+        for owner, polygon in enumerate(self.polygons):
+            for triangle in triangulate(polygon):
+                self.triangles.append(triangle)
+                self.owners.append(owner)
+        
+        self.triangle_index = spatial.GridIndex(self.cell_size)
+        centroids = []
+        for t, (a, b, c) in enumerate(self.triangles):
+            xs, ys = (a[0], b[0], c[0]), (a[1], b[1], c[1])
+            self.triangle_index.insert(t, (min(xs), min(ys), max(xs), max(ys)))
+            centroids.append((sum(xs)/3.0, sum(ys)/3.0))
+        
+        # Leaving a counterclockwise triangle through its edge a->b, b is on the left
+        edge_owners = {}
+        for t, (a, b, c) in enumerate(self.triangles):
+            for p, q in ((a, b), (b, c), (c, a)):
+                edge_owners.setdefault(frozenset((p, q)), []).append((t, p, q))
+        self.graph = {t: {} for t in xrange(len(self.triangles))}
+        self.portals = {}
+        for sides in edge_owners.viewvalues():
+            for t1, p, q in sides:
+                for t2, _, _ in sides:
+                    if t1 != t2:
+                        self.graph[t1][t2] = math.hypot(centroids[t2][0] - centroids[t1][0],
+                                                        centroids[t2][1] - centroids[t1][1])
+                        self.portals[(t1, t2)] = (q, p)
+        self.centroids = centroids
+        
+        self.components = [None] * len(self.triangles)
+        for first in xrange(len(self.triangles)):
+            if self.components[first] is not None:
+                continue
+            stack = [first]
+            self.components[first] = first
+            while stack:
+                for t in self.graph[stack.pop()]:
+                    if self.components[t] is None:
+                        self.components[t] = first
+                        stack.append(t)
+    
+    
+    # Queries
+    
+    def locate(self, point):
+        """Index of the triangle containing point, or None if point is off the mesh"""
+        self.update()
+        for t in self.triangle_index.keys_at(point):
+            a, b, c = self.triangles[t]
+            if _area2(a, b, point) >= 0 and _area2(b, c, point) >= 0 \
+                    and _area2(c, a, point) >= 0:
+                return t
+        return None
+    
+    def _closest_on_triangle(self, t, point):
+        a, b, c = self.triangles[t]
+        candidates = [_closest_point_on_segment(point, p, q) for p, q in ((a, b), (b, c), (c, a))]
+        return min(candidates, key=lambda p: vector.length_squared(vector.tuple_op(p, point)))
+    
+    def _snap(self, point, accept=None):
+        """(triangle, point on it) closest to point, preferring one that contains it"""
+        t = self.locate(point)
+        if t is not None and (accept is None or accept(t)):
+            return t, tuple(point)
+        distance_squared = lambda t: vector.length_squared(
+            vector.tuple_op(self._closest_on_triangle(t, point), point))
+        t = self.triangle_index.nearest(point, distance_squared, accept)
+        if t is None:
+            return None, None
+        return t, self._closest_on_triangle(t, point)
+    
+    def closest_point(self, x, y):
+        """Closest point to (x, y) on the mesh, or None if the mesh is empty"""
+        return self._snap((x, y))[1]
+    
+    def reachable_point_near(self, x, y, src_coords):
+        """Closest point to (x, y) that can be walked to from src_coords"""
+        src_triangle, _ = self._snap(src_coords)
+        if src_triangle is None:
+            return None
+        component = self.components[src_triangle]
+        return self._snap((x, y), lambda t: self.components[t] == component)[1]
+    
+    def path_between(self, src_coords, dest_coords):
+        """
+        Shortest list of coordinates from src_coords to dest_coords, or None if dest_coords
+        cannot be reached. Points off the mesh are first moved to the closest point on it.
+        """
+        src_triangle, start = self._snap(src_coords)
+        dest_triangle, end = self._snap(dest_coords)
+        if src_triangle is None or dest_triangle is None:
+            return None
+        if self.components[src_triangle] != self.components[dest_triangle]:
+            return None
+        if src_triangle == dest_triangle:
+            return [start, end] if start != end else [start]
+        
+        centroids = self.centroids
+        goal = centroids[dest_triangle]
+        heuristic = lambda t: math.hypot(centroids[t][0] - goal[0], centroids[t][1] - goal[1])
+        corridor = astar.shortest_path(self.graph, src_triangle, dest_triangle, heuristic)
+        if corridor is None:
+            return None
+        portals = [(start, start)]
+        portals.extend(self.portals[(t1, t2)] for t1, t2 in zip(corridor, corridor[1:]))
+        portals.append((end, end))
+        return self._pull_string(portals)
+    
+    def _pull_string(self, portals):
+        """Funnel algorithm: the taut path through a list of (left, right) portals"""
+        apex = left = right = portals[0][0]
+        apex_index = left_index = right_index = 0
+        path = [apex]
+        i = 1
+        while i < len(portals):
+            new_left, new_right = portals[i]
+            
+            # Narrow the funnel from the right, unless that crosses the left side. A new
+            # side in line with the other one, as when the apex lies on a portal, still
+            # narrows it.
+            if _area2(apex, right, new_right) >= 0:
+                if apex == right or _area2(apex, left, new_right) <= 0:
+                    right, right_index = new_right, i
+                else:
+                    path.append(left)
+                    apex, apex_index = left, left_index
+                    right, right_index = apex, apex_index
+                    i = apex_index + 1
+                    continue
+            
+            # Same for the left side
+            if _area2(apex, left, new_left) <= 0:
+                if apex == left or _area2(apex, right, new_left) >= 0:
+                    left, left_index = new_left, i
+                else:
+                    path.append(right)
+                    apex, apex_index = right, right_index
+                    left, left_index = apex, apex_index
+                    i = apex_index + 1
+                    continue
+            i += 1
+        
+        path.append(portals[-1][0])
+        return [p for k, p in enumerate(path) if k == 0 or p != path[k-1]]
+    
+    def move_sequence_between(self, src_coords, dest_coords):
+        """Same as WalkPath.move_sequence_between, but with coordinates instead of points"""
+        path = self.path_between(src_coords, dest_coords)
+        if path is None:
+            return dest_coords, None
+        return path[-1], [(p, None) for p in path[1:]]
+    
+    def move_sequence_between_async(self, planner, src_coords, dest_coords, callback):
+        """
+        Like move_sequence_between, but searches on one of planner's worker threads against
+        a snapshot of the mesh. callback(dest_coords, moves) is called on the main loop.
+        """
+        planner.plan(self.snapshot(), src_coords, dest_coords, callback)
+    
+    def snapshot(self):
+        """Immutable NavMeshSnapshot of the current state, rebuilt when the polygons change"""
+        self.update()
+        if self._snapshot is None:
+            self._snapshot = NavMeshSnapshot(self)
+        return self._snapshot
+    
+    
+    # Serialization
+    
+    def dict_repr(self):
+        return {'polygons': [[list(p) for p in polygon] for polygon in self.polygons]}
+    
+    
+    # Drawing
+    
+    def draw(self):
+        self.update()
+        vertices = []
+        for a, b, c in self.triangles:
+            vertices.extend((a[0], a[1], b[0], b[1], b[0], b[1], c[0], c[1],
+                             c[0], c[1], a[0], a[1]))
+        if vertices:
+            draw.set_color(0,0.5,1,0.4)
+            draw.lines(vertices)
+        draw.set_color(0,0.5,1,1)
+        for polygon in self.polygons:
+            if len(polygon) > 1:
+                draw.line_loop([coord for p in polygon for coord in p])
+        draw.rects([(x-4, y-4, x+4, y+4) for polygon in self.polygons for x, y in polygon])
+
+
+class NavMeshSnapshot(NavMesh):
+    """
+    Copy of the triangles and connections of a NavMesh, for searching on worker threads
+    while the original goes on being edited. It has no polygons and never rebuilds, so
+    queries only ever read it.
+    """
+    def __init__(self, navmesh):
+        navmesh.update()
+        super(NavMeshSnapshot, self).__init__(cell_size=navmesh.cell_size)
+        self.dirty = False
+        self.triangles = tuple(navmesh.triangles)
+        self.owners = tuple(navmesh.owners)
+        self.graph = {t: dict(neighbors) for t, neighbors in navmesh.graph.viewitems()}
+        self.portals = dict(navmesh.portals)
+        self.components = tuple(navmesh.components)
+        self.centroids = tuple(navmesh.centroids)
+        for t, box in navmesh.triangle_index.boxes.viewitems():
+            self.triangle_index.insert(t, box)
+    
+    def update(self):
+        pass
@@ -0,0 +1,52 @@
+import Queue, threading, traceback
+
+class PathPlanner(object):
+    """
+    Runs walk path searches on worker threads so that event handlers don't stall the frame.
+    Jobs are searched against graphs that no longer change, such as CompactGraph snapshots
+    or an up to date NavMesh, and their results are handed back on the main loop by poll().
+    """
+    def __init__(self, num_workers=1):
+        self.jobs = Queue.Queue()
+        self.results = Queue.Queue()
+        self.workers = []
+        for i in xrange(num_workers):
+            worker = threading.Thread(target=self._work, name='PathPlanner-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+    
+    def plan(self, graph, src_point, dest_point, callback):
+        """Search graph from src_point to dest_point, then call callback(dest_point, moves)"""
+        self.jobs.put((graph, src_point, dest_point, callback))
+    
+    def deliver(self, callback, *args):
+        """Queue an already known result so it arrives like any other"""
+        self.results.put((callback, args))
+    
+    def _work(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            graph, src_point, dest_point, callback = job
+            try:
+                result = graph.move_sequence_between(src_point, dest_point)
+            except Exception:
+                traceback.print_exc()
+                result = (dest_point, None)
+            self.results.put((callback, result))
+    
+    def poll(self):
+        """Call the callbacks of all finished searches. Must be called from the main loop."""
+        while True:
+            try:
+                callback, args = self.results.get_nowait()
+            except Queue.Empty:
+                return
+            callback(*args)
+    
+    def stop(self):
+        for worker in self.workers:
+            self.jobs.put(None)
+        self.workers = []
@@ -1,55 +1,132 @@
+"""
+Drop shadows under actors.
+
+Each shadow is a quad in the same batch as the sprite casting it, in a group ordered below
+every sprite. ShadowedSprite marks its shadow dirty whenever pyglet repositions the sprite,
+and ShadowSet.flush() rewrites the dirty quads once per frame, so shadows of actors
+standing still cost nothing and a sprite moved several times in a frame is written once.
+"""
+
 import pyglet
 from pyglet.gl import *
 
-class ShadowManager(object):
-    def __init__(self):
-        super(ShadowManager, self).__init__()
-        self.batch = pyglet.graphics.Batch()
-        
-        self.shadow_image = pyglet.resource.image('ui/shadow.png')
-        
-        self.group = pyglet.sprite.SpriteGroup(self.shadow_image.texture,
-            blend_src=GL_SRC_ALPHA, blend_dest=GL_ONE_MINUS_SRC_ALPHA)
-        
-        self.rel_cache = {}
-        self.targets = []
+_shadow_image = None
+rel_cache = {}
+
+def shadow_image():
+    global _shadow_image
+    if _shadow_image is None:
+        _shadow_image = pyglet.resource.image('ui/shadow.png')
+    return _shadow_image
+
+def shadow_group(parent=None):
+    """Group for shadows drawn beneath all of parent's sprites"""
+    below_sprites = pyglet.graphics.OrderedGroup(-1, parent)
+    return pyglet.sprite.SpriteGroup(shadow_image().texture, GL_SRC_ALPHA,
+                                     GL_ONE_MINUS_SRC_ALPHA, below_sprites)
+
+def rel_pos(img):
+    """(x offset, y offset, width, height) of the shadow quad for an image"""
+    try:
+        img.width
+    except AttributeError:
+        img = img.frames[0].image
+    if not rel_cache.has_key(img):
+        w, h = shadow_image().width, shadow_image().height
+        iw, ih = img.width, img.height
+        scale = float(iw)/float(w)*0.8
+        rel_cache[img] = (-w*scale*0.5, -h*scale*0.3, w*scale, h*scale)
+    return rel_cache[img]
+
+class ShadowSet(object):
+    """The shadows of one scene, and which of them need their quads rewritten"""
+    def __init__(self, parent=None):
+        self.group = shadow_group(parent)
+        self.dirty = set()
+    
+    def flush(self):
+        """Rewrite the quads of shadows whose sprites changed since the last flush"""
+        if not self.dirty:
+            return
+        for s in self.dirty:
+            s.update()
+        self.dirty.clear()
+
+
+class Shadow(object):
+    def __init__(self, sprite, shadows):
+        self.sprite = sprite
+        self.shadows = shadows
+        self.group = shadows.group
         self.vertex_list = None
+        self.batch = None
+        self.quad = None    # Coordinates last written, to skip writes that change nothing
+        self.set_batch(sprite.batch)
     
-    def set_targets(self, new_targets):
-        if self.vertex_list:
+    def set_batch(self, batch):
+        if batch is self.batch:
+            return
+        self.batch = batch
+        if self.vertex_list is not None:
             self.vertex_list.delete()
-        self.vertex_list = None
-        
-        self.targets = new_targets
-        num = len(self.targets)
-        
-        if num > 0:
-            self.vertex_list = self.batch.add(4*num, GL_QUADS, self.group,
-                'v2i', 'c4B', ('t3f', self.shadow_image.texture.tex_coords*num))
-            for n in xrange(0, num):
-                self.vertex_list.vertices[n*8:(n+1)*8] = [0, 0, 0, 0, 0, 0, 0, 0]
-                self.vertex_list.colors[n*16:(n+1)*16] = [255,255,255,255] * 4
-    
-    def rel_pos(self, img):
-        try:
-            img.width
-        except AttributeError:
-            img = img.frames[0].image
-        if not self.rel_cache.has_key(img):
-            w, h = self.shadow_image.width, self.shadow_image.height
-            iw, ih = img.width, img.height
-            scale = float(iw)/float(w)*0.8
-            self.rel_cache[img] = (-w*scale*0.5, -h*scale*0.3, w*scale, h*scale)
-        return self.rel_cache[img]
-    
-    def draw(self, dt=0):
-        if self.vertex_list:
-            w, h = self.shadow_image.width,self.shadow_image.height
-            verts, clrs = self.vertex_list.vertices, self.vertex_list.colors
-            for n, t in enumerate(self.targets):
-                rel_x, rel_y, ww, hh = self.rel_pos(t.image)
-                x = t.x + rel_x
-                y = t.y + rel_y
-                verts[n*8:(n+1)*8] = map(int,[x,y,x+ww,y,x+ww,y+hh,x,y+hh])
-            self.batch.draw()
+            self.vertex_list = None
+        self.quad = None
+        if batch is not None:
+            self.vertex_list = batch.add(4, GL_QUADS, self.group,
+                'v2i', ('c4B', [255,255,255,255] * 4),
+                ('t3f', shadow_image().texture.tex_coords))
+            self.update()
     
+    def mark_dirty(self):
+        self.shadows.dirty.add(self)
+    
+    def update(self):
+        if self.vertex_list is None:
+            return
+        s = self.sprite
+        if s.visible:
+            rel_x, rel_y, ww, hh = rel_pos(s.image)
+            x = s.x + rel_x
+            y = s.y + rel_y
+            self.write(map(int,[x,y,x+ww,y,x+ww,y+hh,x,y+hh]))
+        else:
+            self.write([0, 0, 0, 0, 0, 0, 0, 0])
+    
+    def write(self, quad):
+        if quad != self.quad:
+            self.quad = quad
+            self.vertex_list.vertices[:] = quad
+    
+    def delete(self):
+        self.set_batch(None)
+        self.shadows.dirty.discard(self)
+
+
+class ShadowedSprite(pyglet.sprite.Sprite):
+    """
+    Sprite that casts a Shadow in a ShadowSet. The shadow follows the sprite's batch at
+    once, and its position at the next ShadowSet.flush().
+    """
+    def __init__(self, img, shadows, *args, **kwargs):
+        self.shadow = None
+        super(ShadowedSprite, self).__init__(img, *args, **kwargs)
+        self.shadow = Shadow(self, shadows)
+    
+    def _update_position(self):
+        super(ShadowedSprite, self)._update_position()
+        if self.shadow is not None:
+            self.shadow.mark_dirty()
+    
+    def _set_batch(self, batch):
+        super(ShadowedSprite, self)._set_batch(batch)
+        if self.shadow is not None:
+            self.shadow.set_batch(batch)
+    
+    batch = property(lambda self: self._batch, _set_batch)
+    
+    def delete(self):
+        if self.shadow is not None:
+            self.shadow.delete()
+            self.shadow = None
+        super(ShadowedSprite, self).delete()
+
@@ -0,0 +1,109 @@
+import collections
+
+class GridIndex(object):
+    """Uniform grid of bounding boxes for fast nearest-object queries"""
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self.cells = collections.defaultdict(set)   # (cell x, cell y): set of keys
+        self.key_cells = {}                         # key: list of cells it occupies
+        self.boxes = {}                             # key: (min x, min y, max x, max y)
+        
+        # Range of cells that have ever been occupied. Never shrinks on removal, which only
+        # costs a few empty cell visits.
+        self.min_cell = None
+        self.max_cell = None
+    
+    def __len__(self):
+        return len(self.boxes)
+    
+    def cell_of(self, point):
+        return (int(point[0] // self.cell_size), int(point[1] // self.cell_size))
+    
+    def insert(self, key, box):
+        """Add or move the object called key, which occupies box"""
+        if self.boxes.has_key(key):
+            self.remove(key)
+        (min_cx, min_cy) = self.cell_of(box[0:2])
+        (max_cx, max_cy) = self.cell_of(box[2:4])
+        occupied = [(cx, cy) for cx in xrange(min_cx, max_cx+1)
+                             for cy in xrange(min_cy, max_cy+1)]
+        for cell in occupied:
+            self.cells[cell].add(key)
+        self.key_cells[key] = occupied
+        self.boxes[key] = box
+        
+        if self.min_cell is None:
+            self.min_cell = (min_cx, min_cy)
+            self.max_cell = (max_cx, max_cy)
+        else:
+            self.min_cell = (min(min_cx, self.min_cell[0]), min(min_cy, self.min_cell[1]))
+            self.max_cell = (max(max_cx, self.max_cell[0]), max(max_cy, self.max_cell[1]))
+    
+    def remove(self, key):
+        if not self.boxes.has_key(key):
+            return
+        for cell in self.key_cells.pop(key):
+            keys = self.cells[cell]
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+        del self.boxes[key]
+    
+    def keys_at(self, point):
+        """Keys whose boxes contain point"""
+        for key in self.cells.get(self.cell_of(point), ()):
+            x1, y1, x2, y2 = self.boxes[key]
+            if x1 <= point[0] <= x2 and y1 <= point[1] <= y2:
+                yield key
+    
+    def _ring(self, cx, cy, r):
+        """Yield the occupied-range cells at Chebyshev distance r from (cx, cy)"""
+        (min_cx, min_cy), (max_cx, max_cy) = self.min_cell, self.max_cell
+        if r == 0:
+            yield (cx, cy)
+            return
+        for x in xrange(max(cx-r, min_cx), min(cx+r, max_cx)+1):
+            if cy-r >= min_cy:
+                yield (x, cy-r)
+            if cy+r <= max_cy:
+                yield (x, cy+r)
+        for y in xrange(max(cy-r+1, min_cy), min(cy+r-1, max_cy)+1):
+            if cx-r >= min_cx:
+                yield (cx-r, y)
+            if cx+r <= max_cx:
+                yield (cx+r, y)
+    
+    def nearest(self, point, distance_squared, accept=None):
+        """
+        Return the key minimizing distance_squared(key), searching outward from point.
+        distance_squared(key) must be the squared distance from point to the object.
+        Keys for which accept(key) is false are skipped. Returns None if nothing qualifies.
+        """
+        if not self.boxes:
+            return None
+        cx, cy = self.cell_of(point)
+        (min_cx, min_cy), (max_cx, max_cy) = self.min_cell, self.max_cell
+        first_ring = max(0, min_cx-cx, cx-max_cx, min_cy-cy, cy-max_cy)
+        last_ring = max(abs(cx-min_cx), abs(cx-max_cx), abs(cy-min_cy), abs(cy-max_cy))
+        
+        best_key = None
+        best_dist = None
+        seen = set()
+        for r in xrange(first_ring, last_ring+1):
+            # Everything not yet seen lies in cells at least r-1 cells away
+            if best_dist is not None and r > 1:
+                bound = (r-1) * self.cell_size
+                if bound*bound >= best_dist:
+                    break
+            for cell in self._ring(cx, cy, r):
+                for key in self.cells.get(cell, ()):
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    if accept is not None and not accept(key):
+                        continue
+                    dist = distance_squared(key)
+                    if best_dist is None or dist < best_dist:
+                        best_key = key
+                        best_dist = dist
+        return best_key
@@ -0,0 +1,83 @@
+import Queue, itertools, threading, traceback
+
+import pyglet
+
+import atlas
+
+class ImageStreamer(object):
+    """
+    Decodes image resources on worker threads so that scrolling onto new tiles doesn't stall
+    the frame. Requests are decoded lowest priority first. The decoded images come back
+    through poll(), which uploads them to textures on the main loop, since OpenGL calls
+    can't be made from the workers.
+    """
+    def __init__(self, num_workers=1):
+        self.jobs = Queue.PriorityQueue()
+        self.results = Queue.Queue()
+        self.pending = {}   # key: ticket of the request still wanted for it
+        self.tickets = itertools.count()
+        self.workers = []
+        for i in xrange(num_workers):
+            worker = threading.Thread(target=self._work, name='ImageStreamer-%d' % i)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+    
+    def request(self, key, path, priority=0, optional=False):
+        """
+        Decode the image at path, then hand it to poll()'s callback with key. Does nothing
+        if key is already requested. If optional, a missing file isn't reported.
+        """
+        if self.pending.has_key(key):
+            return
+        ticket = next(self.tickets)
+        self.pending[key] = ticket
+        self.jobs.put((priority, ticket, key, path, optional))
+    
+    def cancel(self, key):
+        """Forget a request. A worker skips it if it hasn't been started yet."""
+        self.pending.pop(key, None)
+    
+    def _work(self):
+        while True:
+            priority, ticket, key, path, optional = self.jobs.get()
+            if path is None:
+                return
+            if self.pending.get(key) != ticket:
+                continue
+            try:
+                image_data = atlas.load_image_data(path)
+            except pyglet.resource.ResourceNotFoundException:
+                if not optional:
+                    print "Missing image %s" % path
+                image_data = None
+            except Exception:
+                traceback.print_exc()
+                image_data = None
+            self.results.put((ticket, key, image_data))
+    
+    def poll(self, callback, max_uploads=2):
+        """
+        Upload up to max_uploads decoded images and call callback(key, texture) for each,
+        with None for images that couldn't be loaded. Must be called from the main loop.
+        """
+        uploads = 0
+        while uploads < max_uploads:
+            try:
+                ticket, key, image_data = self.results.get_nowait()
+            except Queue.Empty:
+                return
+            if self.pending.get(key) != ticket:
+                continue    # Cancelled while it was decoding
+            del self.pending[key]
+            if image_data is None:
+                callback(key, None)
+                continue
+            callback(key, image_data.get_texture())
+            uploads += 1
+    
+    def stop(self):
+        self.pending = {}
+        for worker in self.workers:
+            self.jobs.put((float('-inf'), -1, None, None, False))
+        self.workers = []
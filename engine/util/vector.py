@@ -65,3 +65,13 @@ def closest_point_on_line(point, a, b):
     
     # move from point a to the nearest point on the segment
     return tuple_op(a, v, operator.add)
+
+def dist_squared_to_segment(point, a, b):
+    """Squared distance from (point) to the closest point on the segment from (a) to (b)"""
+    ab = tuple_op(b, a, operator.sub)
+    ap = tuple_op(point, a, operator.sub)
+    l = length_squared(ab)
+    if l == 0:
+        return length_squared(ap)
+    t = min(max(dot(ap, ab) / float(l), 0.0), 1.0)
+    return dist_squared_between(point, tuple_op(a, scalar_mult(ab, t), operator.add))
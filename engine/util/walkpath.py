@@ -1,7 +1,42 @@
-import collections
-import draw, vector, dijkstra
+import collections, hashlib, json
+import draw, vector, astar, compactgraph, dijkstra, edgearray, hierarchy, scc, spatial
+
+def intern_identifier(identifier):
+    """Share one string object per identifier instead of one per JSON occurrence"""
+    try:
+        return intern(str(identifier))
+    except UnicodeEncodeError:
+        return identifier
+
+def smooth_moves(start, moves, tolerance=1.0):
+    """
+    Collapse runs of moves into single straight moves where every skipped point lies
+    within tolerance of the straight line, and the whole run uses the same animation.
+    start is the position before the first move; moves is [(coords, anim), ...].
+    """
+    if not moves:
+        return moves
+    tolerance_squared = tolerance*tolerance
+    smoothed = []
+    anchor = start
+    i = 0
+    while i < len(moves):
+        # Extend the run from anchor as far as the line stays clear of skipped points
+        j = i
+        while j+1 < len(moves) and moves[j+1][1] == moves[i][1]:
+            end = moves[j+1][0]
+            if any(vector.dist_squared_to_segment(moves[k][0], anchor, end) > tolerance_squared
+                   for k in xrange(i, j+1)):
+                break
+            j += 1
+        smoothed.append(moves[j])
+        anchor = moves[j][0]
+        i = j+1
+    return smoothed
 
 class Edge(object):
+    __slots__ = ('a', 'b', 'anim', 'annotations', 'counterpart')
+    
     def __init__(self, a, b, anim=None, annotations=None):
         self.a = a
         self.b = b
@@ -21,27 +56,196 @@ class Edge(object):
     
 
 class WalkPath(object):
+    # Walk paths with at least this many points are searched through a ClusterHierarchy
+    # when the end points are far apart. Below it, flat A* on the compact graph is faster.
+    hierarchy_threshold = 10000
+    # Only walk paths with fewer points than this get a baked route table, which grows
+    # with the square of the number of points
+    route_table_limit = 256
+    
     def __init__(self, dict_repr=None):
         self.points = {}
         self.edges = {}
+        
+        # Search graph of the form {a: {b: edge length}}, kept in sync with points and
+        # edges by the mutators below so that searches never have to rebuild it.
+        self.adjacency = collections.defaultdict(dict)
+        self.point_edges = collections.defaultdict(set)    # identifier: keys of touching edges
+        self.edge_index = spatial.GridIndex()               # Bounding boxes of connected edges
+        self.version = 0    # Bumped on every structural change
+        
+        # All-pairs route table of the form {src: {dest: (next point, distance)}}, baked
+        # by the editor for walk paths below route_table_limit points. Only trusted while
+        # routes_version matches version. routes_signature is the signature() it was
+        # solved for, so baking again without real changes costs nothing.
+        self.routes = None
+        self.routes_version = None
+        self.routes_signature = None
+        
+        # Strongly connected component of each point, and for each component a bitmask of
+        # the components reachable from it. Recomputed lazily when version changes.
+        self.components = {}
+        self.reachable_components = []
+        self.components_version = None
+        
+        self._edge_array = None
+        self._edge_array_version = None
+        self._compact = None
+        self._compact_version = None
+        
+        # Recently solved paths, {(src, dest): path or None}, valid for path_cache_version
+        self.path_cache = {}
+        self.path_cache_version = None
+        self.path_cache_limit = 4096
+        
+        self.hierarchy = None   # Created by cluster_hierarchy() once the walk path is large
+        
         if dict_repr:
             for identifier, point_dict in dict_repr['points'].viewitems():
+                identifier = intern_identifier(identifier)
                 self.points[identifier] = (int(point_dict['x']), int(point_dict['y']))
             for edge_dict in dict_repr['edges']:
-                new_edge = self.add_edge(edge_dict['a'], edge_dict['b'])
+                new_edge = self.add_edge(intern_identifier(edge_dict['a']), 
+                                         intern_identifier(edge_dict['b']))
                 if edge_dict.has_key('anim'):
                     new_edge.anim = edge_dict['anim']
+            if dict_repr.has_key('routes'):
+                self.load_routes(dict_repr['routes'])
     
     def dict_repr(self):
-        return {'points': {identifier : {'x': point[0], 'y': point[1]} \
-                           for identifier, point in self.points.viewitems()},
-                'edges': [edge.dict_repr() for edge in self.edges.viewvalues()]}
+        dict_repr = {'points': {identifier : {'x': point[0], 'y': point[1]} \
+                                for identifier, point in self.points.viewitems()},
+                     'edges': [edge.dict_repr() for edge in self.edges.viewvalues()]}
+        if self.routes_are_fresh() and len(self.points) < self.route_table_limit:
+            dict_repr['routes'] = {'signature': self.routes_signature, 
+                                   'table': self.routes}
+        return dict_repr
     
     def dijkstra_repr(self):
-        G = collections.defaultdict(dict)
-        for edge in self.edges.viewvalues():
-            G[edge.a][edge.b] = vector.dist_between(self.points[edge.a], self.points[edge.b])
-        return G
+        return self.adjacency
+    
+    # Baked routes
+    
+    def signature(self):
+        """Digest of the point coordinates and edges, used to detect stale route tables"""
+        # Coordinates are truncated the same way loading does
+        points = [(identifier, vector.round_down(point)) for identifier, point 
+                  in self.points.viewitems()]
+        contents = [sorted(points), sorted(self.edges.viewkeys())]
+        return hashlib.md5(json.dumps(contents)).hexdigest()
+    
+    def bake_routes(self):
+        """
+        Solve and store the shortest route between every pair of points. Walk paths of
+        route_table_limit points or more are too large for a table, so they get none and
+        are searched instead. Nothing is solved if the points and edges haven't changed.
+        """
+        if len(self.points) >= self.route_table_limit:
+            self.routes = None
+            self.routes_version = self.routes_signature = None
+            return
+        signature = self.signature()
+        if self.routes is None or self.routes_signature != signature:
+            self.routes = {src: dijkstra.single_source(self.adjacency, src) 
+                           for src in self.points.viewkeys()}
+            self.routes_signature = signature
+        self.routes_version = self.version
+    
+    def load_routes(self, routes_repr):
+        if len(self.points) < self.route_table_limit and \
+                routes_repr.get('signature') == self.signature():
+            self.routes = {src: {dest: tuple(route) for dest, route in table.viewitems()}
+                           for src, table in routes_repr['table'].viewitems()}
+            self.routes_version = self.version
+            self.routes_signature = routes_repr['signature']
+    
+    def routes_are_fresh(self):
+        return self.routes is not None and self.routes_version == self.version
+    
+    def _route_from_table(self, src_point, dest_point):
+        """Follow baked next hops from src_point, or return False if the table can't answer"""
+        path = [src_point]
+        while path[-1] != dest_point:
+            table = self.routes.get(path[-1])
+            if table is None:
+                return False
+            if not table.has_key(dest_point):
+                # The table knows every route from a point, so a missing one doesn't exist
+                return None if len(path) == 1 else False
+            path.append(table[dest_point][0])
+            if len(path) > len(self.points):
+                return False
+        return path
+    
+    # Reachability
+    
+    def _update_components(self):
+        if self.components_version == self.version:
+            return
+        component_lists = scc.strongly_connected_components(self.adjacency, self.points)
+        self.components = {}
+        for i, component in enumerate(component_lists):
+            for identifier in component:
+                self.components[identifier] = i
+        
+        # Components come out sinks first, so successors are always already filled in
+        self.reachable_components = []
+        for i, component in enumerate(component_lists):
+            mask = 1 << i
+            for identifier in component:
+                for neighbor in self.adjacency.get(identifier, ()):
+                    j = self.components[neighbor]
+                    if j != i:
+                        mask |= self.reachable_components[j]
+            self.reachable_components.append(mask)
+        self.components_version = self.version
+    
+    def can_reach(self, src_point, dest_point):
+        self._update_components()
+        if not self.components.has_key(src_point) or not self.components.has_key(dest_point):
+            return False
+        reachable = self.reachable_components[self.components[src_point]]
+        return bool(reachable >> self.components[dest_point] & 1)
+    
+    def reachable_point_near(self, x, y, src_point):
+        """
+        Point closest to (x, y) that can be walked to from src_point. If src_point isn't on
+        the walk path, this is just the closest point.
+        """
+        self._update_components()
+        if not self.components.has_key(src_point):
+            return self.point_near(x, y)
+        reachable = self.reachable_components[self.components[src_point]]
+        is_reachable = lambda p: self.components.has_key(p) and \
+                                 reachable >> self.components[p] & 1
+        dest_edge = self.closest_edge_to_point((x, y), accept_point=is_reachable)
+        if dest_edge is None:
+            return src_point
+        return self._closer_end(dest_edge, (x, y))
+    
+    # Graph maintenance
+    
+    def _connect(self, key):
+        """Add the edge at key to the search graph if both of its points exist"""
+        a, b = key
+        if self.points.has_key(a) and self.points.has_key(b):
+            (ax, ay), (bx, by) = self.points[a], self.points[b]
+            self.adjacency[a][b] = vector.dist_between((ax, ay), (bx, by))
+            self.edge_index.insert(key, (min(ax, bx), min(ay, by), max(ax, bx), max(ay, by)))
+    
+    def _disconnect(self, key):
+        a, b = key
+        if self.adjacency.has_key(a):
+            self.adjacency[a].pop(b, None)
+        self.edge_index.remove(key)
+    
+    def _changed(self, point=None, edge=None):
+        self.version += 1
+        if self.hierarchy is not None:
+            if point is not None:
+                self.hierarchy.point_changed(point)
+            if edge is not None:
+                self.hierarchy.edge_changed(*edge)
     
     def add_point(self, x, y, identifier=None):
         if self.points.has_key(identifier):
@@ -52,8 +256,33 @@ class WalkPath(object):
                 next_identifier += 1
             identifier = "point_%d" % next_identifier
         self.points[identifier] = (x, y)
+        # Edges may outlive their points while the editor renames or moves them
+        for key in self.point_edges[identifier]:
+            self._connect(key)
+        self._changed(point=identifier)
         return identifier
     
+    def move_point(self, identifier, x, y):
+        """Change the coordinates of an existing point and its edge lengths"""
+        self.points[identifier] = (x, y)
+        for key in self.point_edges[identifier]:
+            self._connect(key)
+        self._changed(point=identifier)
+    
+    def rename_point(self, old_identifier, new_identifier):
+        """Give a point a new identifier, updating every edge that touches it"""
+        if old_identifier == new_identifier or self.points.has_key(new_identifier):
+            return
+        old_edges = [self.edges[key] for key in list(self.point_edges[old_identifier])]
+        for edge in old_edges:
+            self.remove_edge(edge.a, edge.b)
+        self.points[new_identifier] = self.points.pop(old_identifier)
+        self._changed(point=old_identifier)
+        self._changed(point=new_identifier)
+        rename = lambda p: new_identifier if p == old_identifier else p
+        for edge in old_edges:
+            self.add_edge(rename(edge.a), rename(edge.b), edge.anim, edge.annotations)
+    
     def add_edge(self, p1, p2, *args, **kwargs):
         if self.edges.has_key((p1, p2)):
             return self.edges[(p1, p2)]
@@ -64,6 +293,10 @@ class WalkPath(object):
                 other_way = self.edges[(p2, p1)]
                 new_edge.counterpart = other_way
                 other_way.counterpart = new_edge
+            self.point_edges[p1].add((p1, p2))
+            self.point_edges[p2].add((p1, p2))
+            self._connect((p1, p2))
+            self._changed(edge=(p1, p2))
             return new_edge
     
     def remove_point(self, identifier):
@@ -71,6 +304,9 @@ class WalkPath(object):
             del self.points[identifier]
         except KeyError:
             return
+        for key in self.point_edges[identifier]:
+            self._disconnect(key)
+        self._changed(point=identifier)
     
     def remove_edge(self, p1, p2):
         if self.edges.has_key((p1, p2)):
@@ -78,19 +314,76 @@ class WalkPath(object):
             if e.counterpart:
                 e.counterpart.counterpart = None
             del self.edges[(p1, p2)]
+            self.point_edges[p1].discard((p1, p2))
+            self.point_edges[p2].discard((p1, p2))
+            self._disconnect((p1, p2))
+            self._changed(edge=(p1, p2))
     
     def point_near(self, x, y, exclude=None):
-        dest_coords = (x, y)
-        dest_edge = self.closest_edge_to_point(dest_coords, exclude)
-        dist_sq_to_a = vector.dist_squared_between(dest_coords, self.points[dest_edge.a])
-        dist_sq_to_b = vector.dist_squared_between(dest_coords, self.points[dest_edge.b])
+        dest_edge = self.closest_edge_to_point((x, y), exclude)
+        return self._closer_end(dest_edge, (x, y))
+    
+    def _closer_end(self, edge, coords):
+        """Whichever end point of edge is closer to coords"""
+        dist_sq_to_a = vector.dist_squared_between(coords, self.points[edge.a])
+        dist_sq_to_b = vector.dist_squared_between(coords, self.points[edge.b])
         if dist_sq_to_a < dist_sq_to_b:
-            return dest_edge.a
+            return edge.a
         else:
-            return dest_edge.b
+            return edge.b
     
-    def move_sequence_between(self, src_point, dest_point):
-        path = dijkstra.shortest_path(self.dijkstra_repr(), src_point, dest_point)
+    def shortest_path(self, src_point, dest_point):
+        """List of point identifiers from src_point to dest_point, or None if unreachable"""
+        if not self.points.has_key(src_point) or not self.points.has_key(dest_point):
+            return None
+        if self.routes_are_fresh():
+            path = self._route_from_table(src_point, dest_point)
+            if path is not False:
+                return path
+        cache = self._path_cache()
+        if not cache.has_key((src_point, dest_point)):
+            if len(self.points) >= self.hierarchy_threshold and \
+                    self.cluster_hierarchy().far_apart(src_point, dest_point):
+                path = self.cluster_hierarchy().shortest_path(src_point, dest_point)
+            else:
+                path = self.compact().shortest_path(src_point, dest_point)
+            cache[(src_point, dest_point)] = path
+        return cache[(src_point, dest_point)]
+    
+    def cluster_hierarchy(self):
+        """ClusterHierarchy over this walk path, kept up to date from then on"""
+        if self.hierarchy is None:
+            self.hierarchy = hierarchy.ClusterHierarchy(self)
+        return self.hierarchy
+    
+    def shortest_paths_from(self, src_point, dest_points):
+        """Like shortest_path for many destinations, sharing one search. {dest: path}"""
+        results = {}
+        unsolved = []
+        cache = self._path_cache()
+        for dest_point in dest_points:
+            if self.routes_are_fresh() or cache.has_key((src_point, dest_point)):
+                results[dest_point] = self.shortest_path(src_point, dest_point)
+            else:
+                unsolved.append(dest_point)
+        if unsolved:
+            solved = self.compact().shortest_paths_from(src_point, unsolved)
+            for dest_point, path in solved.viewitems():
+                cache[(src_point, dest_point)] = path
+            results.update(solved)
+        return results
+    
+    def _path_cache(self):
+        if self.path_cache_version != self.version or \
+                len(self.path_cache) >= self.path_cache_limit:
+            self.path_cache = {}
+            self.path_cache_version = self.version
+        return self.path_cache
+    
+    def move_sequence_for_path(self, dest_point, path):
+        """Turn a list of identifiers into (dest_point, [(coords, anim), ...])"""
+        if path is None:
+            return dest_point, None
         previous_identifier = path[0]
         move_dests = []
         for identifier in path[1:]:
@@ -98,6 +391,44 @@ class WalkPath(object):
             previous_identifier = identifier
         return dest_point, move_dests
     
+    def _smoothed(self, src_point, sequence, smooth):
+        dest_point, moves = sequence
+        if smooth and moves and self.points.has_key(src_point):
+            tolerance = 1.0 if smooth is True else smooth
+            moves = smooth_moves(self.points[src_point], moves, tolerance)
+        return dest_point, moves
+    
+    def move_sequence_between(self, src_point, dest_point, smooth=False):
+        """
+        Return (dest_point, [(coords, anim), ...]), with None for moves if unreachable.
+        If smooth is true, straight runs of moves are merged (see smooth_moves); a number
+        is used as the tolerance in pixels.
+        """
+        path = self.shortest_path(src_point, dest_point)
+        return self._smoothed(src_point, self.move_sequence_for_path(dest_point, path), smooth)
+    
+    def move_sequences_from(self, src_point, dest_points, smooth=False):
+        """move_sequence_between for many destinations. Returns {dest: (dest, moves)}"""
+        paths = self.shortest_paths_from(src_point, dest_points)
+        return {dest: self._smoothed(src_point, self.move_sequence_for_path(dest, path), smooth)
+                for dest, path in paths.viewitems()}
+    
+    def move_sequence_between_async(self, planner, src_point, dest_point, callback, 
+                                    smooth=False):
+        """
+        Like move_sequence_between, but searches on one of planner's worker threads against
+        a snapshot of the walkpath. callback(dest_point, moves) is called on the main loop.
+        """
+        if self.routes_are_fresh():
+            # Walking the baked table is cheaper than handing the search off
+            planner.deliver(callback, *self.move_sequence_between(src_point, dest_point, smooth))
+        elif smooth:
+            def smooth_callback(dest_point, moves):
+                callback(*self._smoothed(src_point, (dest_point, moves), smooth))
+            planner.plan(self.compact(), src_point, dest_point, smooth_callback)
+        else:
+            planner.plan(self.compact(), src_point, dest_point, callback)
+    
     def path_point_near_point(self, mouse):
         close = lambda a, b: abs(a-b) <= 5
         for identifier, point in self.points.viewitems():
@@ -105,36 +436,66 @@ class WalkPath(object):
                 return identifier
         return None
     
-    def closest_edge_to_point(self, point, exclude=None):
-        # Optimize me! Use rectangles.
+    def closest_edge_to_point(self, point, exclude=None, accept_point=None):
+        """
+        Find the edge nearest to point, ignoring edges that touch any point in exclude
+        or any point for which accept_point(identifier) is false
+        """
+        def distance_squared(key):
+            cp = vector.closest_point_on_line(point, self.points[key[0]], self.points[key[1]])
+            return vector.length_squared((point[0]-cp[0], point[1]-cp[1]))
         
-        exclude = exclude or set()
-        closest_point = None
-        closest_dist = None
-        closest_edge = None
-        for edge in [e for e in self.edges.viewvalues() \
-                     if e.a not in exclude and e.b not in exclude]:
-            cp = self.closest_edge_point_to_point(edge, point)
-            test_dist = vector.length_squared((point[0]-cp[0], point[1]-cp[1]))
-            if closest_dist is None or test_dist < closest_dist:
-                closest_point = cp
-                closest_edge = edge
-                closest_dist = test_dist
-        return closest_edge
+        def accept(key):
+            for identifier in key:
+                if exclude and identifier in exclude:
+                    return False
+                if accept_point and not accept_point(identifier):
+                    return False
+            return True
+        
+        if exclude or accept_point:
+            key = self.edge_index.nearest(point, distance_squared, accept)
+        else:
+            key = self.edge_index.nearest(point, distance_squared)
+        if key is None:
+            return None
+        return self.edges[key]
+    
+    def edge_array(self):
+        """Coordinate arrays of every connected edge, rebuilt when the walkpath changes"""
+        if self._edge_array_version != self.version:
+            keys = [key for key in self.edges.viewkeys() 
+                    if self.points.has_key(key[0]) and self.points.has_key(key[1])]
+            self._edge_array = edgearray.EdgeArray(keys, 
+                                                   [self.points[key[0]] for key in keys],
+                                                   [self.points[key[1]] for key in keys])
+            self._edge_array_version = self.version
+        return self._edge_array
+    
+    def closest_edge_points(self, points):
+        """For each of points, return (nearest edge, nearest point on it), or None"""
+        results = []
+        for result in self.edge_array().closest(points):
+            if result is None:
+                results.append(None)
+            else:
+                results.append((self.edges[result[0]], result[1]))
+        return results
     
     def closest_edge_point_to_point(self, edge, point):
         return vector.closest_point_on_line(point, self.points[edge.a], self.points[edge.b])
     
+    def compact(self):
+        """Immutable CompactGraph of the current state, rebuilt when the walkpath changes"""
+        if self._compact_version != self.version:
+            self._compact = compactgraph.CompactGraph(self.points, self.edges)
+            self._compact_version = self.version
+        return self._compact
+    
     def draw(self):
-        for edge in self.edges.viewvalues():
-            ax, ay = self.points[edge.a]
-            bx, by = self.points[edge.b]
-            if edge.counterpart:
-                draw.line(ax, ay, bx, by, colors=(0, 255, 0, 255, 0, 255, 0, 255))
-            else:
-                draw.line(ax, ay, bx, by, colors=(255, 0, 0, 255, 0, 0, 255, 255))
+        graph = self.compact()
+        vertices, colors = graph.line_vertices()
+        if vertices:
+            draw.lines(vertices, colors)
         draw.set_color(1,0,0,1)
-        for point in self.points.viewvalues():
-            draw.rect(point[0]-5, point[1]-5, point[0]+5, point[1]+5)
-    
-
+        draw.rects([(x-5, y-5, x+5, y+5) for x, y in zip(graph.xs, graph.ys)])
@@ -1,65 +1,104 @@
 import pyglet
 
 class ZEnforcer(object):
-    """Ensure that sprites maintain z-order based on some sort key"""
-    def __init__(self, parent_group, sprite_iterator, sort_function):
+    """
+    Ensure that sprites maintain z-order based on some sort key.
+    
+    Sprites live in slots, and slot i draws with the pooled group self.groups[i]. Occupied
+    slots hold sprites sorted from bottom (drawn first) to top. Each update re-sorts them
+    with an insertion sort, which costs little more than one pass when only a few sprites
+    have moved, so the order is correct after every update no matter how far a sprite moved.
+    Only sprites whose rank changed get a new group.
+    
+    Removing a sprite leaves an empty slot behind instead of moving the sprites above it,
+    and adding one fills an empty slot near its rank when there is one. Groups are created
+    only when every slot is taken, and are never thrown away.
+    """
+    def __init__(self, parent_group, sprite_iterator, sort_key):
+        """sort_key(sprite) is smaller for sprites that should be drawn first"""
         self.parent_group = parent_group
         self.sprite_iterator = sprite_iterator
-        self.sort_function = sort_function
+        self.sort_key = sort_key
         self.groups = []
-        self.highest_group = 0
+        self.slots = []     # Sprite or None per group
     
-    def init_groups(self):
-        """Create layer groups, inject __above/__below instance variables"""
-        sprites = list(self.sprite_iterator())
-        self.groups = [pyglet.graphics.OrderedGroup(order=i, parent=self.parent_group) \
-                       for i in xrange(len(sprites))]
-        
-        # Iterate closest to farthest sprite (bottom to top)
-        sorted_sprites = sorted(sprites, self.sort_function)
-        for i in xrange(len(sorted_sprites)):
-            s = sorted_sprites[i]
+    def _new_slot(self):
+        self.groups.append(pyglet.graphics.OrderedGroup(order=len(self.groups),
+                                                        parent=self.parent_group))
+        self.slots.append(None)
+    
+    def _assign(self, i, s):
+        self.slots[i] = s
+        if s is not None and s.group is not self.groups[i]:
             s.group = self.groups[i]
-            s.__below = None  # Sprite drawn below this one (higher on screen)
-            s.__above = None  # Sprite drawn above this one (lower on screen)
-            if i > 0:
-                s.__below = sorted_sprites[i-1]
-            if i < len(sorted_sprites)-1:
-                s.__above = sorted_sprites[i+1]
     
-    def swap_sprite_up(self, s):
-        # A
-        # B
-        # C <- being swapped up
-        # D
-        
-        B = s.__above
-        C = s
-        D = s.__below
-        if B:
-            A = B.__above
-        else:
-            A = None
-        
-        if D:
-            D.__above = B
-        
-        if B:
-            B.__below = D
-            B.__above = C
-        
-        if C:
-            C.__below = B
-            C.__above = A
-        
-        if A:
-            A.__below = C
+    def init_groups(self):
+        """Sort every sprite from sprite_iterator into the lowest slots"""
+        sprites = sorted(self.sprite_iterator(), key=self.sort_key)
+        while len(self.slots) < len(sprites):
+            self._new_slot()
+        for i in xrange(len(self.slots)):
+            self._assign(i, sprites[i] if i < len(sprites) else None)
+    
+    def add_sprite(self, s):
+        """Give a new sprite its rank, moving as few other sprites as possible"""
+        key = self.sort_key(s)
+        # Slots from 'lowest' to the next occupied slot are all valid places for s
+        lowest = 0
+        for i in xrange(len(self.slots)-1, -1, -1):
+            if self.slots[i] is not None and self.sort_key(self.slots[i]) <= key:
+                lowest = i+1
+                break
+        i = lowest
+        while i < len(self.slots) and self.slots[i] is None:
+            i += 1
+        if i > lowest:
+            self._assign(i-1, s)
+            return
         
-        g1, g2 = B.group, C.group
-        B.group, C.group = g2, g1
+        # Shift the sprites on one side into the nearest free slot, or a new one on top
+        above = lowest
+        while above < len(self.slots) and self.slots[above] is not None:
+            above += 1
+        below = lowest-1
+        while below >= 0 and self.slots[below] is not None:
+            below -= 1
+        if below >= 0 and (above == len(self.slots) or lowest-below < above-lowest):
+            for j in xrange(below, lowest-1):
+                self._assign(j, self.slots[j+1])
+            self._assign(lowest-1, s)
+            return
+        if above == len(self.slots):
+            self._new_slot()
+        for j in xrange(above, lowest, -1):
+            self._assign(j, self.slots[j-1])
+        self._assign(lowest, s)
     
-    def update(self, dt=0):
-        for s in self.sprite_iterator():
-            if s.__above and s.__above.y > s.y:
-                self.swap_sprite_up(s)
+    def remove_sprite(self, s):
+        for i, other in enumerate(self.slots):
+            if other is s:
+                self.slots[i] = None
+                return
     
+    def update(self, dt=0):
+        positions = [i for i, s in enumerate(self.slots) if s is not None]
+        order = [self.slots[i] for i in positions]
+        keys = [self.sort_key(s) for s in order]
+        lowest_moved = len(order)
+        for i in xrange(1, len(order)):
+            key = keys[i]
+            if keys[i-1] <= key:
+                continue
+            s = order[i]
+            j = i
+            while j > 0 and keys[j-1] > key:
+                keys[j] = keys[j-1]
+                order[j] = order[j-1]
+                j -= 1
+            keys[j] = key
+            order[j] = s
+            lowest_moved = min(lowest_moved, j)
+        
+        for k in xrange(lowest_moved, len(order)):
+            self._assign(positions[k], order[k])
+